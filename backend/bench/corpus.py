@@ -0,0 +1,110 @@
+# bench/corpus.py
+import io
+import os
+import random
+from dataclasses import dataclass
+from pypdf import PdfReader
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+# Vocabulary for synthetic homework pages; seeded so the corpus is identical across runs
+TOPICS = [
+    "linear regression", "eigenvalues", "the central limit theorem", "integration by parts",
+    "maximum likelihood", "Bayes' rule", "gradient descent", "the chain rule", "ridge regression",
+    "Markov chains", "the EM algorithm", "hypothesis testing", "Taylor series", "convex sets",
+]
+VERBS = ["Prove that", "Show that", "Compute", "Derive", "Explain why", "Estimate", "Find"]
+OBJECTS = [
+    "the estimator is unbiased", "the variance of the sum", "the limit as n grows",
+    "the gradient of the loss", "the posterior distribution", "the expected value of X",
+    "a closed form for the integral", "the fixed point of the iteration", "the rank of the matrix",
+]
+
+
+@dataclass
+class CorpusDocument:
+    name: str
+    data: bytes
+    pages: int
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages: list) -> bytes:
+    """
+    Write a minimal PDF with one text page per entry of pages (a list of lines).
+    Text is drawn with Tj operators so pypdf extracts it like a real document.
+    """
+    objects = []
+    page_refs = []
+    font_ref = 3 + 2 * len(pages)
+    for index, lines in enumerate(pages):
+        page_ref, content_ref = 3 + 2 * index, 4 + 2 * index
+        page_refs.append(page_ref)
+        stream = "BT /F1 10 Tf 12 TL 50 760 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append((page_ref, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_ref} 0 R >> >> /Contents {content_ref} 0 R >>"
+        ).encode("latin-1")))
+        encoded = stream.encode("latin-1", "replace")
+        objects.append((content_ref, b"<< /Length %d >>\nstream\n" % len(encoded) + encoded + b"\nendstream"))
+    objects.append((font_ref, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"))
+    objects.append((1, b"<< /Type /Catalog /Pages 2 0 R >>"))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects.append((2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode("latin-1")))
+    objects.sort()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for ref, body in objects:
+        offsets[ref] = len(out)
+        out += b"%d 0 obj\n" % ref + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for ref in range(1, len(objects) + 1):
+        out += b"%010d 00000 n \n" % offsets[ref]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def synthetic_pdf(num_pages: int, seed: int, lines_per_page: int = 50) -> bytes:
+    """
+    Homework-like PDF whose text is unique per seed, so cold runs never hit the chunk cache.
+    """
+    rng = random.Random(seed)
+    pages = []
+    for page in range(num_pages):
+        lines = [f"Problem Set {seed} - Page {page + 1}"]
+        for problem in range(lines_per_page // 5):
+            lines.append(f"{page * 10 + problem + 1}. ({rng.randint(2, 10)} pts) {rng.choice(VERBS)} "
+                         f"{rng.choice(OBJECTS)} for {rng.choice(TOPICS)}.")
+            for _ in range(4):
+                lines.append(" ".join(rng.choice(OBJECTS + TOPICS) for _ in range(4)) + f" with x = {rng.random():.4f}.")
+        pages.append(lines)
+    return build_pdf(pages)
+
+
+def build_corpus(sizes: tuple = (1, 5, 20), large_pages: int = 200, seed: int = 0) -> dict:
+    """
+    Return the benchmark corpus: the real sample exam plus synthetic documents of varied sizes.
+    Keys: "small" (list of mid-sized documents, including mid23.pdf) and "large".
+    """
+    with open(os.path.join(ASSETS_DIR, "mid23.pdf"), "rb") as f:
+        real = f.read()
+    documents = [CorpusDocument("mid23.pdf", real, len(PdfReader(io.BytesIO(real)).pages))]
+    for i, pages in enumerate(sizes):
+        documents.append(CorpusDocument(f"synthetic-{pages}p.pdf", synthetic_pdf(pages, seed + i), pages))
+    large = CorpusDocument(f"synthetic-{large_pages}p.pdf", synthetic_pdf(large_pages, seed + 1000), large_pages)
+    return {"small": documents, "large": large}
+
+
+def unique_documents(count: int, pages: int, seed: int = 10000) -> list:
+    """
+    Distinct documents for concurrency scenarios (no two share a cache entry).
+    """
+    return [
+        CorpusDocument(f"concurrent-{i}.pdf", synthetic_pdf(pages, seed + i), pages)
+        for i in range(count)
+    ]
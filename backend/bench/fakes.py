@@ -0,0 +1,194 @@
+# bench/fakes.py
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+logger = logging.getLogger(__name__)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for ChatOpenAI. The reply is derived from a hash of the
+    prompt, and latency is base_latency + prompt_tokens * per_token_latency, so
+    runs are repeatable and roughly shaped like the real API.
+    """
+    base_latency: float = 0.2
+    per_token_latency: float = 0.00002
+    reply_words: int = 60
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4
+
+    def _reply(self, messages) -> tuple:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = prompt.split()[:self.reply_words]
+        content = f"Summary {digest[:8]}: " + " ".join(words)
+        delay = self.base_latency + self.get_num_tokens(prompt) * self.per_token_latency
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))]), delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        result, delay = self._reply(messages)
+        time.sleep(delay)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        result, delay = self._reply(messages)
+        await asyncio.sleep(delay)
+        return result
+
+
+class TavusStubServer:
+    def __init__(self, latency: float = 0.3, port: int = 0):
+        """
+        Local HTTP server answering the Tavus endpoints the app calls, with a fixed latency.
+        Point TAVUS_BASE_URL at base_url before the Tavus client is created.
+        Failures can be scripted in faults: each request takes the next one, a status
+        code to answer with (429s carry Retry-After: 1) or "drop" to close the
+        connection after reading the request. received lists (method, path) of every
+        request that reached the server.
+        """
+        self.latency = latency
+        self.requests = 0
+        self.faults = []
+        self.received = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self, status: int, body: dict) -> None:
+                stub.requests += 1
+                time.sleep(stub.latency)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _fault(self) -> bool:
+                # Reads the request, then plays the next scripted fault if there is one
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.received.append((self.command, self.path))
+                if not stub.faults:
+                    return False
+                fault = stub.faults.pop(0)
+                if fault == "drop":
+                    self.close_connection = True
+                    return True
+                payload = json.dumps({"error": f"scripted {fault}"}).encode("utf-8")
+                self.send_response(fault)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if fault == 429:
+                    self.send_header("Retry-After", "1")
+                self.end_headers()
+                self.wfile.write(payload)
+                return True
+
+            def do_POST(self):
+                if self._fault():
+                    return
+                if self.path.rstrip("/").endswith("/conversations"):
+                    conversation_id = uuid.uuid4().hex[:12]
+                    self._reply(200, {
+                        "conversation_id": conversation_id,
+                        "conversation_url": f"https://tavus.daily.co/{conversation_id}",
+                        "status": "active",
+                    })
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_GET(self):
+                if not self._fault():
+                    self._reply(200, {"status": "ok"})
+
+            do_PATCH = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tavus-stub", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v2"
+
+    def start(self) -> "TavusStubServer":
+        self._thread.start()
+        logger.info("Tavus stub listening on %s", self.base_url)
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeSupabaseClient:
+    def __init__(self, latency: float = 0.01):
+        """
+        In-memory replacement for SupabaseClient's insert/history methods.
+        """
+        self.latency = latency
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def insert_records(self, table: str, rows: list) -> None:
+        time.sleep(self.latency)
+        with self._lock:
+            self.tables.setdefault(table, []).extend(rows)
+
+    def get_user_records(self, table: str, user_id: str, columns: str = "*", limit: int = 20, offset: int = 0) -> list:
+        time.sleep(self.latency)
+        with self._lock:
+            rows = [row for row in self.tables.get(table, []) if row.get("user_id") == user_id]
+        rows.sort(key=lambda row: row.get("created_at", 0), reverse=True)
+        return rows[offset:offset + limit]
+
+
+class FakeAWSClient:
+    def __init__(self, bytes_per_second: float = 50 * 1024 * 1024, latency: float = 0.02):
+        """
+        Simulates S3 archival: a fixed request latency plus transfer time for the file size.
+        """
+        self.bytes_per_second = bytes_per_second
+        self.latency = latency
+        self.uploaded = 0
+
+    async def aupload_path_to_s3(self, path: str, user_id: str, file_ext: str) -> str:
+        size = os.path.getsize(path)
+        await asyncio.sleep(self.latency + size / self.bytes_per_second)
+        self.uploaded += size
+        return f"https://bench-bucket.s3.amazonaws.com/{user_id}/{uuid.uuid4().hex}.{file_ext}"
+
+    async def asave_text_to_s3(self, text: str, user_id: str, compress: bool = False) -> str:
+        await asyncio.sleep(self.latency + len(text) / self.bytes_per_second)
+        return f"https://bench-bucket.s3.amazonaws.com/{user_id}/{uuid.uuid4().hex}.txt"
+
+
+def install(component, value) -> None:
+    """
+    Replace a LazyComponent's value so the app uses a fake instead of building the real client.
+    """
+    component._value = value
+    component._initialized = True
@@ -0,0 +1,296 @@
+# bench/run.py
+"""
+Offline benchmarks for the upload and conversation paths. The app runs in-process
+against a deterministic fake LLM, a local Tavus stub server and fake Supabase/S3
+clients, so no external service is called and no credentials are needed.
+
+    cd backend
+    python -m bench.run                                  # every scenario
+    python -m bench.run --scenarios cold,warm --json results.json
+    python -m bench.run --baseline results.json          # compare with an earlier run
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["cold", "warm", "concurrent", "large", "conversation"]
+
+
+def configure_environment(tavus_base_url: str) -> None:
+    """
+    Settings that must be in place before main is imported.
+    """
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "TAVUS_API_KEY": "bench",
+        "REPLICA_ID": "bench-replica",
+        "PERSONA_ID": "bench-persona",
+        "TAVUS_BASE_URL": tavus_base_url,
+        "ARCHIVE_UPLOADS": "1",
+        "PREWARM": "0",
+        "WEB_CONCURRENCY": "1",
+    })
+    # Rate limits are part of the app, but the default quota would dominate a fast fake LLM
+    os.environ.setdefault("OPENAI_RPM", "100000")
+    os.environ.setdefault("OPENAI_TPM", "100000000")
+    os.environ.setdefault("SUMMARY_CACHE_BACKEND", "memory")
+    # The bench drives more concurrent requests than the default global caps admit; it measures the handlers
+    os.environ.setdefault("ADMISSION_ENABLED", "0")
+
+
+class RSSSampler:
+    def __init__(self, interval: float = 0.05, child_pids=None):
+        """
+        Samples resident memory of this process plus any worker processes
+        (child_pids() returns their pids) and keeps the peak, in bytes.
+        """
+        self.interval = interval
+        self.child_pids = child_pids or (lambda: [])
+        self.peak = 0
+        self._task = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self, pid) -> int:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    def sample(self) -> int:
+        if not os.path.exists("/proc/self/statm"):
+            # ru_maxrss is kilobytes on Linux, bytes on macOS; only the lifetime peak is available
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == "darwin" else maxrss * 1024
+        return self._rss("self") + sum(self._rss(pid) for pid in self.child_pids())
+
+    async def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, self.sample())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self) -> "RSSSampler":
+        self.peak = self.sample()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._task.cancel()
+        self.peak = max(self.peak, self.sample())
+
+
+def summarize_latencies(name: str, latencies: list, errors: int, elapsed: float, peak_rss: int, extra: dict = None) -> dict:
+    from utils.jobs import percentile
+    return {
+        "scenario": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+        **(extra or {}),
+    }
+
+
+class Bench:
+    def __init__(self, main, client, fake_llm, args):
+        self.main = main
+        self.client = client
+        self.fake_llm = fake_llm
+        self.args = args
+
+    def worker_pids(self) -> list:
+        executor = self.main.extraction_pool._executor
+        if executor is None or not getattr(executor, "_processes", None):
+            return []
+        return list(executor._processes)
+
+    def reset_caches(self) -> None:
+        for backend in self.main.cache_backends.values():
+            backend.clear()
+        self.main.document_indexes._indexes.clear()
+
+    async def upload(self, document) -> float:
+        start = time.perf_counter()
+        response = await self.client.post(
+            "/upload",
+            data={"name": "Bench"},
+            files={"file": (document.name, document.data, "application/pdf")}
+        )
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200 or "error" in response.json():
+            raise RuntimeError(f"{document.name}: {response.status_code} {response.text[:200]}")
+        return elapsed
+
+    async def measure(self, name: str, requests: list, concurrency: int = 1) -> dict:
+        """
+        Run the request coroutines (factories) with bounded concurrency and summarize them.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+        llm_calls = self.fake_llm.calls
+
+        async def run_one(request):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    latencies.append(await request())
+                except Exception as e:
+                    errors += 1
+                    print(f"  {name}: {e}", file=sys.stderr)
+
+        with RSSSampler(child_pids=self.worker_pids) as rss:
+            start = time.perf_counter()
+            await asyncio.gather(*[run_one(request) for request in requests])
+            elapsed = time.perf_counter() - start
+        return summarize_latencies(name, latencies, errors, elapsed, rss.peak, {
+            "llm_calls": self.fake_llm.calls - llm_calls,
+        })
+
+    async def cold(self, corpus) -> dict:
+        async def cold_upload(document):
+            self.reset_caches()
+            return await self.upload(document)
+        documents = corpus["small"] * self.args.repeat
+        return await self.measure("cold", [lambda d=d: cold_upload(d) for d in documents])
+
+    async def warm(self, corpus) -> dict:
+        for document in corpus["small"]:
+            await self.upload(document)
+        documents = corpus["small"] * self.args.repeat
+        return await self.measure("warm", [lambda d=d: self.upload(d) for d in documents])
+
+    async def concurrent(self, corpus) -> dict:
+        from bench.corpus import unique_documents
+        self.reset_caches()
+        documents = unique_documents(self.args.concurrency * self.args.repeat, pages=self.args.concurrent_pages)
+        return await self.measure(
+            f"concurrent x{self.args.concurrency}",
+            [lambda d=d: self.upload(d) for d in documents],
+            concurrency=self.args.concurrency
+        )
+
+    async def large(self, corpus) -> dict:
+        async def cold_upload():
+            self.reset_caches()
+            return await self.upload(corpus["large"])
+        return await self.measure(f"large {corpus['large'].pages}p", [cold_upload])
+
+    async def conversation(self, corpus) -> dict:
+        async def create():
+            start = time.perf_counter()
+            response = await self.client.post("/create_conversation", json={"context": "User Name: Bench\n" + "x" * 4000})
+            if response.status_code != 200:
+                raise RuntimeError(f"create_conversation: {response.status_code} {response.text[:200]}")
+            return time.perf_counter() - start
+        return await self.measure(
+            f"conversation x{self.args.concurrency}",
+            [create for _ in range(self.args.concurrency * self.args.repeat * 4)],
+            concurrency=self.args.concurrency
+        )
+
+
+def print_report(results: list, baseline: dict = None) -> None:
+    columns = ["requests", "errors", "p50_ms", "p95_ms", "p99_ms", "throughput_rps", "peak_rss_mb", "llm_calls"]
+    print(f"\n{'scenario':<20}" + "".join(f"{column:>16}" for column in columns))
+    for result in results:
+        print(f"{result['scenario']:<20}" + "".join(f"{result.get(column, ''):>16}" for column in columns))
+        previous = (baseline or {}).get(result["scenario"])
+        if previous:
+            deltas = []
+            for column in columns:
+                old, new = previous.get(column), result.get(column)
+                if isinstance(old, (int, float)) and old and isinstance(new, (int, float)):
+                    deltas.append(f"{(new - old) / old * 100:>+15.1f}%")
+                else:
+                    deltas.append(f"{'':>16}")
+            print(f"{'  vs baseline':<20}" + "".join(deltas))
+
+
+async def run(args) -> list:
+    from bench.fakes import FakeChatModel, TavusStubServer, FakeSupabaseClient, FakeAWSClient, install
+    from bench.corpus import build_corpus
+
+    tavus = TavusStubServer(latency=args.tavus_latency).start()
+    configure_environment(tavus.base_url)
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+
+    import main
+    from utils.persistence import SupabaseBackend
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    fake_llm = FakeChatModel(base_latency=args.llm_latency, per_token_latency=args.llm_per_token_latency)
+    install(main.llm, fake_llm)
+    install(main.persistence, SupabaseBackend(client=FakeSupabaseClient()))
+    install(main.aws_client, FakeAWSClient())
+
+    corpus = build_corpus(large_pages=args.large_pages)
+    import httpx
+    results = []
+    try:
+        async with main.lifespan(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                bench = Bench(main, client, fake_llm, args)
+                for scenario in args.scenarios:
+                    print(f"Running {scenario}...", file=sys.stderr)
+                    results.append(await getattr(bench, scenario)(corpus))
+    finally:
+        tavus.stop()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the upload and conversation paths.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel requests in concurrent scenarios")
+    parser.add_argument("--concurrent-pages", type=int, default=5, help="pages per document in the concurrent scenario")
+    parser.add_argument("--large-pages", type=int, default=200, help="pages in the large document")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM base latency per call (s)")
+    parser.add_argument("--llm-per-token-latency", type=float, default=0.00002, help="fake LLM latency per prompt token (s)")
+    parser.add_argument("--tavus-latency", type=float, default=0.3, help="Tavus stub latency (s)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare with results from an earlier --json run")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logs")
+    args = parser.parse_args(argv)
+    # The run changes into the backend directory, so resolve output paths first
+    args.json = os.path.abspath(args.json) if args.json else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {result["scenario"]: result for result in json.load(f)["results"]}
+
+    results = asyncio.run(run(args))
+    print_report(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"created_at": time.time(), "args": vars(args), "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
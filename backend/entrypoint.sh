@@ -17,7 +17,13 @@ else
     echo "DUMMY_SECRET_KEY=${DUMMY_SECRET_KEY}"
 fi
 
-uvicorn main:app --host 0.0.0.0 --port 8090 --reload
+# SERVER_MODE=production runs several preloaded worker processes (see gunicorn.conf.py);
+# anything else is the single-process auto-reloading development server
+if [ "$SERVER_MODE" = "production" ]; then
+    exec gunicorn main:app -c gunicorn.conf.py
+else
+    uvicorn main:app --host 0.0.0.0 --port 8090 --reload
+fi
 echo "Running."
 
 
@@ -0,0 +1,43 @@
+# gunicorn.conf.py
+# Production server: several uvicorn worker processes behind one gunicorn master.
+import os
+import shutil
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8090')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+# cpu_count() reports the host's cores inside a container, not the container's CPU
+# limit, so the default is small; set WEB_CONCURRENCY to match the limit
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# main.py reads this to split the OpenAI quota per worker and to switch caches
+# and job state to the shared SQLite store
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Workers write Prometheus samples here so /metrics can aggregate all of them.
+# Must be set before the app (and prometheus_client) is imported; cleared on every start.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/educaite-metrics")
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Import the app once in the master so workers fork with the code already loaded.
+# Heavy components stay lazy and are built per worker (or by PREWARM in its lifespan).
+preload_app = True
+
+# On SIGTERM, workers stop accepting connections, finish in-flight requests and
+# drain queued upload jobs in the lifespan shutdown before this deadline
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+# Recycle workers periodically to bound memory growth (jitter avoids restarting all at once)
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+errorlog = "-"
+
+
+def child_exit(server, worker):
+    # Drop live gauges of workers that are gone
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,42 +1,246 @@
 # main.py
-import os
-import logging
-import tempfile
-import whisper
-import uvicorn
-# import ffmpeg
-from openai import OpenAI
-from fastapi import FastAPI, Request, UploadFile, File, Form, Depends, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.templating import Jinja2Templates
-from utils.utils import TavusClient, Utils, AWSClient, SupabaseClient
-from utils.interactions import DailyClient
-
-from langchain.document_loaders import PyPDFLoader
-from langchain.chains import load_summarize_chain
-from langchain_openai import ChatOpenAI  # Updated import
-from langchain.text_splitter import CharacterTextSplitter
-from langchain.prompts import PromptTemplate
-import concurrent.futures  # Import for concurrency
-import numpy as np
-
-map_prompt = PromptTemplate(
-    template="Summarize this content:\n\n{text}",
-    input_variables=["text"]
+from utils.startup import StartupReport, LazyComponent
+
+# Import and init cost per component, served at /startup to track cold-start regressions
+startup_report = StartupReport()
+
+with startup_report.measure("stdlib"):
+    import os
+    import json
+    import time
+    import mimetypes
+    import asyncio
+    import logging
+    from contextlib import AsyncExitStack, asynccontextmanager
+
+with startup_report.measure("fastapi"):
+    from fastapi import FastAPI, Request, UploadFile, File, Form, Depends, HTTPException
+    from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, Response
+    from starlette.background import BackgroundTask
+    from starlette.concurrency import run_in_threadpool
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.templating import Jinja2Templates
+
+# Heavy dependencies (langchain, openai, whisper/torch, boto3, supabase, daily) are
+# imported inside the component factories below, on first use or during prewarm.
+with startup_report.measure("utils"):
+    from utils.utils import AsyncTavusClient, AWSClient
+    from utils.cache import SummaryCache, build_cache_backend
+    from utils.summarize import DocumentSummarizer
+    from utils.extraction import ExtractionPool, ExtractionQueueFull
+    from utils.ingest import spool_upload, UploadTooLarge, UploadLimitMiddleware
+    from utils.context import ContextBuilder
+    from utils.ratelimit import LLMScheduler
+    from utils.jobs import JobQueue, JobQueueFull, SQLiteJobStore
+    from utils.persistence import BatchWriter, build_persistence_backend
+    from utils.interactions import DailySessionManager
+    from utils.context_store import ContextStore, ContextNotFound, ContextConflict, context_delta
+    from utils.admission import AdmissionController, AdmissionMiddleware, build_admission_backend, content_length, take_lease
+    from utils.metrics import (
+        TraceIdFilter, trace_id_var, new_trace_id, render_metrics, track_in_flight, REQUEST_SECONDS
+    )
+
+with startup_report.measure("utils (numpy)"):
+    from utils.transcription import TranscriptionService, TranscriptionError
+    from utils.retrieval import DocumentIndexStore, HashingEmbedder, format_retrieved_context
+
+
+def build_llm():
+    from langchain_openai import ChatOpenAI  # Updated import
+    return ChatOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model="gpt-4o-mini",
+        temperature=0
+    )
+
+llm = LazyComponent("llm", build_llm, startup_report)
+
+# Worker processes sharing this host (set by gunicorn.conf.py). With more than one,
+# caches and job state default to SQLite files every worker can see.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE = WEB_CONCURRENCY > 1
+
+# Chunks follow problem/section boundaries and are packed up to a token budget;
+# long documents get bigger chunks so they never need more than SPLIT_MAX_CHUNKS map calls
+SPLIT_OPTIONS = {
+    "chunk_tokens": int(os.getenv("SPLIT_CHUNK_TOKENS", "1500")),
+    "min_tokens": int(os.getenv("SPLIT_MIN_TOKENS", "300")),
+    "max_chunks": int(os.getenv("SPLIT_MAX_CHUNKS", "64")),
+    "max_chunk_tokens": int(os.getenv("SPLIT_MAX_CHUNK_TOKENS", "4000")),
+}
+
+# Anything that changes the generated summary must be part of the cache key
+SUMMARY_CONFIG = {
+    "model": "gpt-4o-mini",
+    "temperature": 0,
+    "chain_type": "adaptive",
+    "stuff_max_tokens": int(os.getenv("SUMMARY_STUFF_MAX_TOKENS", "12000")),
+    "reduce_max_tokens": int(os.getenv("SUMMARY_REDUCE_MAX_TOKENS", "12000")),
+    "splitter": "structured",
+    **SPLIT_OPTIONS,
+    "result_format": 2,
+}
+
+def build_namespace_cache(namespace: str, max_entries: int, max_mb: int, table: str):
+    # Each namespace has its own backend and budget, so OCR'ing one large scan can't
+    # evict document summaries. In memory, entries are also bounded by total size.
+    prefix = namespace.upper()
+    return build_cache_backend(
+        kind=os.getenv("SUMMARY_CACHE_BACKEND", "sqlite" if SHARED_STATE else "memory"),
+        path=os.getenv("SUMMARY_CACHE_PATH", "cache/summary_cache.sqlite3"),
+        table=table,
+        max_entries=int(os.getenv(f"{prefix}_CACHE_MAX_ENTRIES", str(max_entries))),
+        max_bytes=int(os.getenv(f"{prefix}_CACHE_MAX_MB", str(max_mb))) * 1024 * 1024,
+        ttl_seconds=float(os.getenv("SUMMARY_CACHE_TTL", "0")) or None
+    )
+
+cache_backends = {
+    # Summaries keep the original table of the SQLite file
+    "summary": build_namespace_cache("summary", max_entries=4096, max_mb=256, table="cache"),
+    "chunk": build_namespace_cache("chunk", max_entries=16384, max_mb=64, table="chunk_cache"),
+    "ocr": build_namespace_cache("ocr", max_entries=16384, max_mb=128, table="ocr_cache"),
+}
+
+# Whole-document results, keyed by file hash
+summary_cache = SummaryCache(cache_backends["summary"], config=SUMMARY_CONFIG)
+
+# Map-step partial summaries, keyed by chunk text hash (splitter settings don't affect them)
+chunk_cache = SummaryCache(
+    cache_backends["chunk"],
+    config={"model": SUMMARY_CONFIG["model"], "temperature": SUMMARY_CONFIG["temperature"]},
+    namespace="chunk"
+)
+
+# One scheduler for every upload, sized to this worker's share of the OpenAI account's quota
+llm_scheduler = LLMScheduler(
+    requests_per_minute=max(1, int(os.getenv("OPENAI_RPM", "500")) // WEB_CONCURRENCY),
+    tokens_per_minute=max(1, int(os.getenv("OPENAI_TPM", "200000")) // WEB_CONCURRENCY),
+    max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+)
+
+def build_summarizer():
+    from langchain.chains import load_summarize_chain
+    summary_chain = load_summarize_chain(llm.get(), chain_type="map_reduce")
+    # Documents that fit in one prompt skip map_reduce and take a single "stuff" call
+    stuff_chain = load_summarize_chain(llm.get(), chain_type="stuff")
+    return DocumentSummarizer(
+        summary_chain,
+        chunk_cache=chunk_cache,
+        scheduler=llm_scheduler,
+        stuff_chain=stuff_chain,
+        stuff_max_tokens=SUMMARY_CONFIG["stuff_max_tokens"],
+        reduce_max_tokens=SUMMARY_CONFIG["reduce_max_tokens"]
+    )
+
+summarizer = LazyComponent("summarizer", build_summarizer, startup_report)
+
+# Name, summary and the most relevant page text, packed into a fixed token budget
+context_builder = LazyComponent(
+    "context_builder",
+    lambda: ContextBuilder(token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))),
+    startup_report
+)
+
+# Local vector index per upload, used to answer follow-up questions precisely
+document_indexes = DocumentIndexStore(
+    embedder=HashingEmbedder(dim=int(os.getenv("RETRIEVAL_EMBEDDING_DIM", "1024"))),
+    max_indexes=int(os.getenv("RETRIEVAL_MAX_INDEXES", "256"))
+)
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+# Indexed chunks are much smaller than summary chunks or whole pages, so each
+# question adds a few short excerpts to the conversation context
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "300"))
+RETRIEVAL_SPLIT_OPTIONS = {
+    "chunk_tokens": RETRIEVAL_CHUNK_TOKENS,
+    "min_tokens": RETRIEVAL_CHUNK_TOKENS // 4,
+    "max_chunk_tokens": RETRIEVAL_CHUNK_TOKENS,
+}
+
+# Whisper is loaded once (lazily, or at startup with WHISPER_PREWARM=1) and shared by all requests
+transcription_service = TranscriptionService(
+    model_name=os.getenv("WHISPER_MODEL", "base"),
+    workers=int(os.getenv("WHISPER_WORKERS", "1")),
+    batch_window=float(os.getenv("WHISPER_BATCH_WINDOW", "0.05")),
+    max_batch=int(os.getenv("WHISPER_MAX_BATCH", "8"))
+)
+
+# Upload/conversation history: Supabase when configured, otherwise a local SQLite file
+persistence = LazyComponent(
+    "persistence",
+    lambda: build_persistence_backend(os.getenv("PERSISTENCE_BACKEND"), os.getenv("PERSISTENCE_PATH")),
+    startup_report
+)
+
+# Optional S3 archival of uploaded files (multipart, parallel transfers off the event loop)
+ARCHIVE_UPLOADS = os.getenv("ARCHIVE_UPLOADS", "0") == "1"
+aws_client = LazyComponent(
+    "aws_client",
+    lambda: AWSClient(
+        multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))),
+        multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024))),
+        max_concurrency=int(os.getenv("S3_MAX_CONCURRENCY", "10"))
+    ),
+    startup_report
+)
+
+# Inserts are buffered and written in batches so the DB never sits on the request path
+record_writer = BatchWriter(
+    persistence.get,
+    max_batch=int(os.getenv("PERSISTENCE_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "1.0"))
+)
+
+# One joined Daily call client per live conversation; bursts of context updates
+# are coalesced so only the latest context (or the combined appends) is sent per debounce window
+daily_sessions = DailySessionManager(
+    debounce=float(os.getenv("DAILY_CONTEXT_DEBOUNCE", "0.5")),
+    idle_timeout=float(os.getenv("DAILY_IDLE_TIMEOUT", "300"))
+)
+
+# Conversation contexts live server side, versioned per user. Clients pass context_id
+# instead of the text, and live conversations are only sent what changed
+context_store = ContextStore(
+    os.getenv("CONTEXT_STORE_PATH", "data/contexts.sqlite3"),
+    max_versions=int(os.getenv("CONTEXT_MAX_VERSIONS", "20"))
 )
+# Past this size, a question's excerpts replace the earlier ones instead of piling up
+CONTEXT_MAX_CHARS = int(os.getenv("CONTEXT_MAX_CHARS", "64000"))
+
+# Uploads are streamed to disk in chunks; anything larger is rejected with 413
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+# OCR text per scanned page / image, keyed by file hash and page number
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+ocr_cache = SummaryCache(cache_backends["ocr"], config={"engine": "tesseract", "lang": OCR_LANG}, namespace="ocr")
 
-llm = ChatOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    model="gpt-4o-mini", 
-    temperature=0
+# PDF parsing, OCR and splitting run in worker processes so the event loop stays responsive.
+# Each web worker has its own pool, so by default they split the host's CPUs between them
+extraction_pool = ExtractionPool(
+    max_workers=int(os.getenv("EXTRACTION_WORKERS", "0")) or max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY),
+    max_queue=int(os.getenv("EXTRACTION_QUEUE_DEPTH", "8")),
+    pages_per_task=int(os.getenv("EXTRACTION_PAGES_PER_TASK", "16")),
+    ocr_cache=ocr_cache,
+    ocr_lang=OCR_LANG,
+    ocr_enabled=os.getenv("OCR_ENABLED", "1") == "1"
 )
 
-summary_chain = load_summarize_chain(llm, chain_type="map_reduce")
+
+def is_processable(content_type: str) -> bool:
+    """
+    PDFs are parsed (with OCR for scanned pages); images such as photos of homework are OCR'd.
+    """
+    return content_type == 'application/pdf' or (content_type or "").startswith('image/')
+
+
+def upload_suffix(file: UploadFile) -> str:
+    if file.content_type == 'application/pdf':
+        return ".pdf"
+    # Pillow sniffs the format from the content, the suffix only keeps archived names readable
+    return os.path.splitext(file.filename or "")[1] or mimetypes.guess_extension(file.content_type) or ""
 
 async def format_text(text: str) -> str:
     try:
-        response = llm.invoke(
+        response = llm.get().invoke(
             f"""Format this content so it is easier to read in plain text:
             {text}
             
@@ -47,18 +251,118 @@ async def format_text(text: str) -> str:
         logger.error(f"Error formatting text: {e}")
         return ""
 
-# Configure logging
+# Configure logging; every line carries the trace id of the request that produced it
+log_handlers = [logging.StreamHandler(), logging.FileHandler("app.log")]
+for handler in log_handlers:
+    handler.addFilter(TraceIdFilter())
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s %(levelname)s %(name)s %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("app.log")
-    ]
+    format='%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s',
+    handlers=log_handlers
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+PREWARM = os.getenv("PREWARM", "0") == "1"
+
+
+def prewarm():
+    """
+    Build every lazy component up front (PREWARM=1), trading a slower boot for a fast first request.
+    """
+    components = [llm, summarizer, context_builder, tavus_client, record_prompt, persistence]
+    if ARCHIVE_UPLOADS:
+        components.append(aws_client)
+    for component in components:
+        try:
+            component.get()
+        except Exception as e:
+            logger.error("Failed to prewarm %s: %s", component.name, e)
+    if os.getenv("WHISPER_PREWARM", "0") == "1":
+        with startup_report.measure("whisper", phase="init"):
+            transcription_service.warm_up()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upload_jobs.start()
+    await record_writer.start()
+    await daily_sessions.start()
+    if PREWARM:
+        await run_in_threadpool(prewarm)
+    startup_report.mark_ready()
+    startup_report.log()
+
+    yield
+
+    await upload_jobs.stop(drain=True)
+    await daily_sessions.aclose()
+    await record_writer.aclose()
+    await transcription_service.aclose()
+    extraction_pool.shutdown()
+    if tavus_client.initialized:
+        await tavus_client.get().aclose()
+
+
+# Admission control for the expensive endpoints: per-user rate limits and concurrency
+# caps, a global cap, and a queue where small uploads go ahead of large ones. Shed
+# requests get 429/503 with Retry-After. With several workers the counters live in
+# a SQLite file so the caps hold host-wide. The per-user limits stay off until
+# get_current_user is real authentication: with the mock user they would apply to
+# the whole site.
+ADMISSION_PER_USER = os.getenv("ADMISSION_PER_USER", "0") == "1"
+admission_backend = build_admission_backend(
+    os.getenv("ADMISSION_BACKEND", "sqlite" if SHARED_STATE else "memory"),
+    os.getenv("ADMISSION_PATH", "data/admission.sqlite3")
+)
+upload_admission = AdmissionController(
+    "upload",
+    admission_backend,
+    max_concurrent=int(os.getenv("ADMISSION_UPLOAD_MAX_CONCURRENT", "8")),
+    max_per_user=int(os.getenv("ADMISSION_UPLOAD_MAX_PER_USER", "2")),
+    rate_per_minute=float(os.getenv("ADMISSION_UPLOAD_RATE_PER_MINUTE", "20")),
+    burst=float(os.getenv("ADMISSION_UPLOAD_BURST", "5")),
+    max_queue=int(os.getenv("ADMISSION_UPLOAD_MAX_QUEUE", "64")),
+    max_queue_per_user=int(os.getenv("ADMISSION_UPLOAD_MAX_QUEUE_PER_USER", "4")),
+    max_wait=float(os.getenv("ADMISSION_UPLOAD_MAX_WAIT", "60")),
+    # An upload queues as if it arrived one second later per this many bytes
+    cost_rate=float(os.getenv("ADMISSION_UPLOAD_BYTES_PER_SECOND", str(1024 * 1024))),
+    lease_ttl=float(os.getenv("WORKER_TIMEOUT", "300")) * 2,
+    per_user=ADMISSION_PER_USER
+)
+conversation_admission = AdmissionController(
+    "conversation",
+    admission_backend,
+    max_concurrent=int(os.getenv("ADMISSION_CONVERSATION_MAX_CONCURRENT", "16")),
+    max_per_user=int(os.getenv("ADMISSION_CONVERSATION_MAX_PER_USER", "2")),
+    rate_per_minute=float(os.getenv("ADMISSION_CONVERSATION_RATE_PER_MINUTE", "10")),
+    burst=float(os.getenv("ADMISSION_CONVERSATION_BURST", "3")),
+    max_queue=int(os.getenv("ADMISSION_CONVERSATION_MAX_QUEUE", "32")),
+    max_queue_per_user=int(os.getenv("ADMISSION_CONVERSATION_MAX_QUEUE_PER_USER", "2")),
+    max_wait=float(os.getenv("ADMISSION_CONVERSATION_MAX_WAIT", "15")),
+    per_user=ADMISSION_PER_USER
+)
+ADMISSION_ROUTES = {
+    ("POST", "/upload"): (upload_admission, content_length),
+    ("POST", "/upload/stream"): (upload_admission, content_length),
+    ("POST", "/upload/jobs"): (upload_admission, content_length),
+    ("POST", "/create_conversation"): (conversation_admission, None),
+}
+
+
+app = FastAPI(lifespan=lifespan)
+# Added before CORS so shed responses still carry CORS headers; runs before the body is read
+app.add_middleware(
+    AdmissionMiddleware,
+    routes=ADMISSION_ROUTES,
+    user_resolver=lambda request: get_current_user(request),
+    enabled=os.getenv("ADMISSION_ENABLED", "1") == "1"
+)
+# Oversized bodies get 413 before they are spooled (and before taking an admission slot)
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=MAX_UPLOAD_BYTES,
+    paths={"/upload", "/upload/stream", "/upload/jobs"}
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://app.explainstein.com", "https://explainstein.com", "https://educaite-871207387231.us-west1.run.app"],
@@ -69,8 +373,42 @@ app.add_middleware(
 
 templates = Jinja2Templates(directory="templates")
 
-# Initialize Tavus client
-tavus_client = TavusClient()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Assign each request a trace id (or reuse the caller's X-Request-ID), echo it
+    back in the response and record per-route latency.
+    """
+    trace_id = request.headers.get("x-request-id") or new_trace_id()
+    trace_id_var.set(trace_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        with track_in_flight("requests"):
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        # Label by route template, not raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status)
+        ).observe(time.perf_counter() - start)
+
+# Initialize Tavus client (shared keep-alive pool, safe to await from handlers)
+tavus_client = LazyComponent(
+    "tavus_client",
+    lambda: AsyncTavusClient(
+        timeout=float(os.getenv("TAVUS_TIMEOUT", "10")),
+        max_retries=int(os.getenv("TAVUS_MAX_RETRIES", "3")),
+        max_concurrency=int(os.getenv("TAVUS_MAX_CONCURRENCY", "10"))
+    ),
+    startup_report
+)
 
 # Mock user authentication (replace with actual authentication logic)
 def get_current_user(request: Request):
@@ -86,6 +424,138 @@ async def preflight_handler():
     return JSONResponse(content={}, status_code=200)
 
 
+async def archive_upload(upload, user_id: str) -> str:
+    """
+    Archive the original file to S3 when ARCHIVE_UPLOADS=1 and return its URL.
+    Archival failures are logged, never fatal; the content hash stands in for the URL.
+    """
+    if ARCHIVE_UPLOADS:
+        try:
+            file_ext = upload.suffix.lstrip(".") or "bin"
+            return await (await aws_client.aget()).aupload_path_to_s3(await upload.path(), user_id, file_ext)
+        except Exception as e:
+            logger.error("Failed to archive upload %s: %s", upload.digest, e)
+    return f"sha256:{upload.digest}"
+
+
+async def build_document_index(upload_id: str, documents: list):
+    """
+    Split page Documents into small retrieval chunks (in the extraction pool) and
+    embed them into the upload's index in a thread, keeping the event loop free.
+    """
+    chunks = await extraction_pool.split(documents, **RETRIEVAL_SPLIT_OPTIONS)
+    return await run_in_threadpool(document_indexes.build, upload_id, chunks)
+
+
+async def ensure_document_index(upload_id: str, pages: list):
+    """
+    Return the retrieval index for an upload, rebuilding it from cached page text
+    when this worker process has not built it yet.
+    """
+    index = document_indexes.get(upload_id)
+    if index is None:
+        from langchain.docstore.document import Document
+        index = await build_document_index(upload_id, [
+            Document(page_content=text, metadata={"page": page_number})
+            for page_number, text in enumerate(pages)
+        ])
+    return index
+
+
+async def store_context(user_id: str, context: str) -> dict:
+    """
+    Save a context in the context store; the response carries the context_id
+    clients pass to /create_conversation instead of the text.
+    """
+    stored = await run_in_threadpool(context_store.create, user_id, context)
+    return stored.to_dict()
+
+
+# conversation_id -> [lock, number of requests using it]
+conversation_locks = {}
+
+
+@asynccontextmanager
+async def conversation_updates(conversation_id: str):
+    """
+    Let one request at a time change a conversation's context, so each update starts
+    from the version the conversation was actually sent.
+    """
+    entry = conversation_locks.setdefault(conversation_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del conversation_locks[conversation_id]
+
+
+async def push_context(conversation_id: str, conversation_url: str, old: str, new: str) -> str:
+    """
+    Send a live conversation only what changed between the context it holds and
+    the new one, and wait until it has been delivered (raises if it wasn't).
+    Returns the update mode ("append" or "overwrite"), or None.
+    """
+    mode, delta = context_delta(old, new)
+    if mode == "append" and not delta:
+        return None
+    # Joins the room on first use; the send itself happens after the debounce window
+    await daily_sessions.get_session(conversation_id, conversation_url)
+    await daily_sessions.send_context(conversation_id, conversation_url, delta, mode=mode)
+    return mode
+
+
+async def process_document(upload, emit=None, content_type: str = 'application/pdf') -> dict:
+    """
+    Extract (OCR'ing images and scanned pages), split and summarize a spooled upload.
+    emit, if given, is awaited with a progress event dict after each stage.
+    """
+    async def notify(event: str, **data):
+        if emit is not None:
+            await emit({"event": event, **data})
+
+    with track_in_flight("uploads"):
+        cached = await summary_cache.get(upload.digest)
+        if cached is not None:
+            logger.info("Summary cache hit for: %s", upload.digest)
+            await notify("cache_hit")
+            await ensure_document_index(upload.digest, cached["pages"])
+            return {**cached, "upload_id": upload.digest}
+
+        if content_type.startswith('image/'):
+            documents = await extraction_pool.load_image(await upload.path(), upload.digest)
+        else:
+            documents = await extraction_pool.load_pdf(await upload.path(), upload.digest)
+        await notify("pages", count=len(documents), ocr=sum(1 for doc in documents if doc.metadata.get("ocr")))
+        extracted = any(doc.page_content.strip() for doc in documents)
+        if not extracted:
+            logger.warning("No text could be extracted from upload: %s", upload.digest)
+
+        splits = await extraction_pool.split(documents, **SPLIT_OPTIONS)
+        await notify("chunks", count=len(splits))
+
+        # Per-upload vector index for follow-up questions
+        await build_document_index(upload.digest, documents)
+
+        logger.info(f"Number of text chunks created: {len(splits)}")
+
+        # Map only new/changed chunks, then reduce over all partial summaries
+        summary = await (await summarizer.aget()).summarize(
+            splits,
+            on_partial=lambda index, partial: notify("partial", index=index, summary=partial)
+        )
+
+        logger.info("Summary generated for the upload.")
+
+        result = {"summary": summary, "pages": [doc.page_content for doc in documents]}
+        # An empty extraction may only mean OCR is unavailable here, so it is retried next time
+        if extracted:
+            await summary_cache.set(upload.digest, result)
+        return {**result, "upload_id": upload.digest}
+
+
 @app.post("/upload")
 async def upload_document(
     request: Request,
@@ -100,79 +570,312 @@ async def upload_document(
         return RedirectResponse("/login", status_code=302)
 
     # Initialize context with user's name
-    context = f"User Name: {name}\n"
+    context = (await context_builder.aget()).build(name)
+    upload_id = None
 
     if file:
         logger.info("Processing uploaded file: %s", file.filename)
         try:
-            if file.content_type == 'application/pdf':
-                logger.info("File is a PDF. Processing with LangChain.")
+            if is_processable(file.content_type):
+                logger.info("Processing %s upload.", file.content_type)
 
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                    tmp.write(await file.read())
-                    tmp_path = tmp.name
-                logger.info("Temporary PDF saved at: %s", tmp_path)
+                async with spool_upload(file, max_bytes=MAX_UPLOAD_BYTES, suffix=upload_suffix(file)) as upload:
+                    # The original file is archived while it is being summarized
+                    result, file_url = await asyncio.gather(
+                        process_document(upload, content_type=file.content_type),
+                        archive_upload(upload, user_id)
+                    )
 
-                loader = PyPDFLoader(tmp_path)
-                documents = loader.load()
+                context = (await context_builder.aget()).build(name, result["summary"], result["pages"])
+                upload_id = result["upload_id"]
+                record_writer.enqueue("uploads", {
+                    "user_id": user_id,
+                    "file_url": file_url,
+                    "description": file.filename
+                })
 
-                print("documents", documents)
-
-                text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-                splits = text_splitter.split_documents(documents)
+            else:
+                logger.info("Uploaded file type is not supported for processing.")
+                pass  # Do nothing for other file types
 
-                logger.info(f"Number of text chunks created: {len(splits)}")
+        except UploadTooLarge as e:
+            logger.warning("Rejecting upload from %s: %s", user_id, str(e))
+            raise HTTPException(status_code=413, detail=str(e))
+        except ExtractionQueueFull as e:
+            logger.warning("Rejecting upload from %s: %s", user_id, str(e))
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        except Exception as e:
+            logger.error("Error processing the uploaded file: %s", str(e))
+            return {"error": f"File processing failed: {str(e)}"}
+    else:
+        logger.info("No file uploaded. Proceeding with name only.")
 
-                # Asynchronously call the summarization chain
-                summary_result = await summary_chain.acall({"input_documents": splits})
+    return JSONResponse(
+        content={"context": context, "upload_id": upload_id, **await store_context(user_id, context)},
+        status_code=200
+    )
 
-                # Access the summarized text
-                summary = summary_result['output_text']
 
-                print("summary", summary)
+@app.post("/upload/stream")
+async def upload_document_stream(
+    request: Request,
+    name: str = Form(...),
+    file: UploadFile = File(None),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Streaming variant of /upload. Emits NDJSON progress events (pages, chunks, one
+    "partial" per map summary, "summary") and finishes with a "context" event carrying
+    the same context string and context_id /upload returns.
+    """
+    logger.info("Received streaming upload request from user: %s", user_id)
 
-                logger.info("Summary generated for the PDF.")
+    if not user_id:
+        logger.warning("User not authenticated")
+        return RedirectResponse("/login", status_code=302)
 
-                context += f"# Document Summary:\n{summary}"
+    context = (await context_builder.aget()).build(name)
 
-                context += f"# Document Raw Content:\n{documents}"
+    # Spool the file before responding; the temp file lives until the stream ends
+    uploads = AsyncExitStack()
+    upload = None
+    if file and is_processable(file.content_type):
+        try:
+            upload = await uploads.enter_async_context(
+                spool_upload(file, max_bytes=MAX_UPLOAD_BYTES, suffix=upload_suffix(file))
+            )
+        except UploadTooLarge as e:
+            await uploads.aclose()
+            raise HTTPException(status_code=413, detail=str(e))
+    elif file:
+        logger.info("Uploaded file type is not processed: %s", file.content_type)
 
-                os.unlink(tmp_path)
-                logger.info("Temporary PDF file deleted.")
+    async def events():
+        queue = asyncio.Queue()
+        task = None
+        archive = None
+        try:
+            yield json.dumps({"event": "received", "bytes": upload.size if upload else 0}) + "\n"
+            if upload is None:
+                yield json.dumps({"event": "context", "context": context, **await store_context(user_id, context)}) + "\n"
+                return
 
-            elif file.content_type.startswith('image/'):
-                logger.info("Uploaded file is an image. No processing applied.")
-                pass  # Do nothing for images
-
-            else:
-                logger.info("Uploaded file type is not supported for processing.")
-                pass  # Do nothing for other file types
+            task = asyncio.create_task(process_document(upload, emit=queue.put, content_type=file.content_type))
+            archive = asyncio.create_task(archive_upload(upload, user_id))
+            while not task.done() or not queue.empty():
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield json.dumps(getter.result()) + "\n"
+                else:
+                    getter.cancel()
 
+            result = task.result()
+            record_writer.enqueue("uploads", {
+                "user_id": user_id,
+                "file_url": await archive,
+                "description": file.filename
+            })
+            yield json.dumps({"event": "summary", "summary": result["summary"]}) + "\n"
+            full_context = (await context_builder.aget()).build(name, result["summary"], result["pages"])
+            yield json.dumps({
+                "event": "context",
+                "context": full_context,
+                "upload_id": result["upload_id"],
+                **await store_context(user_id, full_context)
+            }) + "\n"
+        except ExtractionQueueFull as e:
+            logger.warning("Rejecting upload from %s: %s", user_id, str(e))
+            yield json.dumps({"event": "error", "detail": str(e), "retry_after": 5}) + "\n"
         except Exception as e:
             logger.error("Error processing the uploaded file: %s", str(e))
-            return {"error": f"File processing failed: {str(e)}"}
-    else:
-        logger.info("No file uploaded. Proceeding with name only.")
+            yield json.dumps({"event": "error", "detail": f"File processing failed: {str(e)}"}) + "\n"
+        finally:
+            # Client went away mid-stream: stop summarizing before removing the file
+            if task is not None and not task.done():
+                task.cancel()
+            if archive is not None:
+                await asyncio.gather(archive, return_exceptions=True)
+            await uploads.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        background=BackgroundTask(uploads.aclose)
+    )
+
+
+async def run_upload_job(job) -> dict:
+    """
+    Job handler: process the spooled upload, then remove the temp file it owns
+    and release the admission slot it was submitted with. Jobs wait for room in a
+    full extraction pool instead of failing.
+    """
+    trace_id_var.set(job.payload["trace_id"])
+    try:
+        delay = 0.5
+        while True:
+            try:
+                result = await process_document(job.payload["upload"], content_type=job.payload["content_type"])
+                break
+            except ExtractionQueueFull:
+                logger.info("Extraction pool full, retrying job %s in %.1fs", job.id, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        # Finished jobs stay in memory and in the job store; the page text is in the summary cache
+        return {"upload_id": result["upload_id"], "summary": result["summary"], "name": job.payload["name"]}
+    finally:
+        await job.payload["uploads"].aclose()
+
+
+# With several worker processes, job state lives in SQLite so any worker can answer polls
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "data/jobs.sqlite3" if SHARED_STATE else "")
+upload_jobs = JobQueue(
+    run_upload_job,
+    workers=int(os.getenv("UPLOAD_JOB_WORKERS", "4")),
+    max_depth=int(os.getenv("UPLOAD_JOB_QUEUE_DEPTH", "64")),
+    store=SQLiteJobStore(JOB_STORE_PATH, retention=float(os.getenv("JOB_RETENTION_SECONDS", "86400"))) if JOB_STORE_PATH else None
+)
+
+
+@app.post("/upload/jobs", status_code=202)
+async def submit_upload_job(
+    request: Request,
+    name: str = Form(...),
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_current_user)
+):
+    """
+    Queue a PDF or image for background processing and return a job id immediately.
+    Poll GET /jobs/{job_id} for the status and, once done, the context. Resubmitting
+    a file this user already processed returns the finished job with its context.
+    """
+    logger.info("Received upload job request from user: %s", user_id)
+
+    if not user_id:
+        logger.warning("User not authenticated")
+        return RedirectResponse("/login", status_code=302)
+
+    if not is_processable(file.content_type):
+        raise HTTPException(status_code=415, detail="Only PDF and image uploads can be processed as jobs")
 
-    return JSONResponse(content={"context": context}, status_code=200)
+    uploads = AsyncExitStack()
+    lease = take_lease(request)
+    if lease is not None:
+        # The upload slot is held until the job has run, not just until the 202 is sent
+        uploads.push_async_callback(lease.release)
+    try:
+        upload = await uploads.enter_async_context(
+            spool_upload(file, max_bytes=MAX_UPLOAD_BYTES, suffix=upload_suffix(file))
+        )
+        # The job outlives this request and Starlette's spooled copy of the body
+        await upload.path()
+        # Jobs are per user (the result carries the submitter's name); another user's
+        # copy of the same file still skips the work through the summary cache
+        job, created = await upload_jobs.submit(f"{user_id}:{upload.digest}", {
+            "upload": upload,
+            "uploads": uploads,
+            "name": name,
+            "content_type": file.content_type,
+            "trace_id": trace_id_var.get()
+        })
+    except UploadTooLarge as e:
+        await uploads.aclose()
+        raise HTTPException(status_code=413, detail=str(e))
+    except JobQueueFull as e:
+        await uploads.aclose()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except BaseException:
+        await uploads.aclose()
+        raise
+
+    if not created:
+        # Same file is already queued or processed; the temp file isn't needed
+        await uploads.aclose()
+
+    content = job.to_dict()
+    if job.status == "done":
+        # A resubmitted file that is already processed gets its context right away
+        content.update(await job_context(job, name, user_id))
+    return JSONResponse(content=content, status_code=202)
+
+
+@app.get("/jobs/metrics", response_class=JSONResponse)
+async def job_metrics():
+    """
+    Queue depth, worker utilisation and wait/run latency percentiles for upload jobs.
+    """
+    return upload_jobs.metrics()
+
+
+async def job_context(job, name: str, user_id: str) -> dict:
+    """
+    upload_id, context and context_id of a finished upload job, for the given user's name.
+    """
+    cached = await summary_cache.get(job.result["upload_id"])
+    if cached is None:
+        logger.warning("Pages of upload %s are no longer cached; context has the summary only", job.result["upload_id"])
+    context = (await context_builder.aget()).build(name, job.result["summary"], cached["pages"] if cached else None)
+    # Polling again returns the same context_id
+    return {"upload_id": job.result["upload_id"], "context": context, **await store_context(user_id, context)}
+
+
+@app.get("/jobs/{job_id}", response_class=JSONResponse)
+async def get_upload_job(job_id: str, name: str = None, user_id: str = Depends(get_current_user)):
+    job = await upload_jobs.get(job_id)
+    if job is None or not job.key.startswith(f"{user_id}:"):
+        raise HTTPException(status_code=404, detail="Unknown job id")
+
+    content = job.to_dict()
+    if job.status == "done":
+        content.update(await job_context(job, name or job.result["name"], user_id))
+    return content
 
 
 @app.post("/create_conversation")
-async def create_conversation(request: Request):
+async def create_conversation(request: Request, user_id: str = Depends(get_current_user)):
     try:
         # Get the JSON body from the request
         body = await request.json()
-        context = body.get('context')
-        
-        if not context:
-            raise HTTPException(status_code=422, detail="Context is required")
-
-        logger.info("Creating conversation with Tavus AI with context length: %d", len(context))
-        conversation_url = tavus_client.create_conversation(
-            context=context,
+        context_id = body.get('context_id')
+
+        # Clients pass the context_id from an upload; the full text is still accepted
+        if context_id:
+            base = await run_in_threadpool(context_store.get, user_id, context_id, body.get('version'))
+        elif body.get('context'):
+            base = await run_in_threadpool(context_store.create, user_id, body['context'])
+        else:
+            raise HTTPException(status_code=422, detail="context_id or context is required")
+
+        # "append" (e.g. the recording's section) extends the base for this conversation only
+        content = base.content + (body.get('append') or "")
+
+        logger.info("Creating conversation with Tavus AI with context length: %d", len(content))
+        tavus = await tavus_client.aget()
+        conversation_url = await tavus.create_conversation(
+            context=content,
             callback_url="https://yourwebsite.com/webhook"
         )
-        return JSONResponse(content={"conversation_url": conversation_url}, status_code=200)
+        conversation_id = tavus.get_conversation_id(conversation_url)
+        # Each conversation gets its own branch, so what it adds later stays out of other conversations
+        stored = await run_in_threadpool(context_store.fork, user_id, base, content)
+        await run_in_threadpool(context_store.attach, user_id, conversation_id, stored, conversation_url)
+        record_writer.enqueue("conversations", {
+            "user_id": user_id,
+            "conversation_url": conversation_url,
+            # The text is in the context store; history keeps a reference to the exact version
+            "context": f"context:{stored.context_id}@{stored.version}"
+        })
+        return JSONResponse(content={
+            "conversation_url": conversation_url,
+            "conversation_id": conversation_id,
+            **stored.to_dict(),
+            "base": base.to_dict()
+        }, status_code=200)
+    except ContextNotFound:
+        raise HTTPException(status_code=404, detail="Unknown context_id")
+    except HTTPException:
+        raise
     except ValueError as e:
         # Handle JSON parsing errors
         logger.error("Invalid JSON in request: %s", str(e))
@@ -182,6 +885,179 @@ async def create_conversation(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
     
 
+@app.post("/conversations/{conversation_id}/question")
+async def focus_conversation(conversation_id: str, request: Request, user_id: str = Depends(get_current_user)):
+    """
+    Retrieve the chunks of an uploaded document most relevant to a student's question
+    and push them into the live conversation's LLM context. Only the new excerpts are
+    sent; once they are delivered the conversation's context branch gets a new version.
+    """
+    try:
+        body = await request.json()
+    except ValueError as e:
+        logger.error("Invalid JSON in request: %s", str(e))
+        raise HTTPException(status_code=422, detail="Invalid JSON format")
+
+    upload_id = body.get('upload_id')
+    question = body.get('question')
+    if not all([upload_id, question]):
+        raise HTTPException(status_code=422, detail="upload_id, question and conversation_url are required")
+
+    index = document_indexes.get(upload_id)
+    if index is None:
+        # The upload may have been processed by another worker process
+        cached = await summary_cache.get(upload_id)
+        if cached is None:
+            raise HTTPException(status_code=404, detail="Unknown upload_id")
+        index = await ensure_document_index(upload_id, cached["pages"])
+
+    hits = index.search(question, k=RETRIEVAL_TOP_K)
+
+    async with conversation_updates(conversation_id):
+        held, stored_url = await run_in_threadpool(context_store.for_conversation, user_id, conversation_id)
+        conversation_url = body.get('conversation_url') or stored_url
+        if not conversation_url:
+            raise HTTPException(status_code=422, detail="upload_id, question and conversation_url are required")
+
+        base = held.content if held is not None else body.get('context', "")
+        context = format_retrieved_context(base, question, hits)
+        if held is not None and len(context) > CONTEXT_MAX_CHARS:
+            # Start over from the branch's first version rather than growing without bound
+            root = await run_in_threadpool(context_store.get, user_id, held.context_id, 1)
+            context = format_retrieved_context(root.content, question, hits)
+
+        try:
+            if held is not None:
+                mode = await push_context(conversation_id, conversation_url, base, context)
+                # Only a delivered context becomes the version the conversation holds
+                _, stored = await run_in_threadpool(context_store.update, user_id, held.context_id, context)
+                await run_in_threadpool(context_store.attach, user_id, conversation_id, stored, conversation_url)
+            else:
+                # Conversations the context store doesn't know about: the client's copy is overwritten
+                stored = None
+                mode = "overwrite"
+                await daily_sessions.get_session(conversation_id, conversation_url)
+                await daily_sessions.update_context(conversation_id, conversation_url, context)
+        except Exception as e:
+            logger.error("Error updating conversation context: %s", str(e))
+            raise HTTPException(status_code=500, detail=str(e))
+
+    logger.info("Pushed %d excerpts (%s) to conversation: %s", len(hits), mode, conversation_id)
+    return JSONResponse(content={
+        "excerpts": [
+            {"score": score, "text": text, "page": metadata.get("page")}
+            for score, text, metadata in hits
+        ],
+        **(stored.to_dict() if stored is not None else {})
+    }, status_code=200)
+
+
+@app.post("/contexts", status_code=201)
+async def create_context(request: Request, user_id: str = Depends(get_current_user)):
+    """
+    Store a context written by the client; returns its context_id and version.
+    """
+    try:
+        body = await request.json()
+    except ValueError as e:
+        logger.error("Invalid JSON in request: %s", str(e))
+        raise HTTPException(status_code=422, detail="Invalid JSON format")
+    if not body.get('context'):
+        raise HTTPException(status_code=422, detail="Context is required")
+    return JSONResponse(content=await store_context(user_id, body['context']), status_code=201)
+
+
+@app.get("/contexts/{context_id}", response_class=JSONResponse)
+async def get_context(context_id: str, version: int = None, user_id: str = Depends(get_current_user)):
+    try:
+        stored = await run_in_threadpool(context_store.get, user_id, context_id, version)
+    except ContextNotFound:
+        raise HTTPException(status_code=404, detail="Unknown context_id or version")
+    return {**stored.to_dict(), "context": stored.content}
+
+
+@app.patch("/contexts/{context_id}", response_class=JSONResponse)
+async def patch_context(context_id: str, request: Request, user_id: str = Depends(get_current_user)):
+    """
+    Change a stored context with {"append": text} or {"context": full_text}, optionally
+    guarded by "base_version" (409 if it is stale). A conversation's branch
+    (the context_id /create_conversation returned) is sent only the difference
+    from the version it holds; new conversations fork the updated version.
+    """
+    try:
+        body = await request.json()
+    except ValueError as e:
+        logger.error("Invalid JSON in request: %s", str(e))
+        raise HTTPException(status_code=422, detail="Invalid JSON format")
+    if not body.get('append') and not body.get('context'):
+        raise HTTPException(status_code=422, detail="append or context is required")
+
+    try:
+        if body.get('append'):
+            latest = await run_in_threadpool(context_store.get, user_id, context_id)
+            content = latest.content + body['append']
+        else:
+            content = body['context']
+        _, stored = await run_in_threadpool(
+            context_store.update, user_id, context_id, content, body.get('base_version')
+        )
+    except ContextNotFound:
+        raise HTTPException(status_code=404, detail="Unknown context_id")
+    except ContextConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    conversations = await run_in_threadpool(context_store.conversations, user_id, context_id)
+    updated = []
+    for conversation_id, version, conversation_url in conversations:
+        if version >= stored.version or not conversation_url:
+            continue
+        try:
+            async with conversation_updates(conversation_id):
+                # Re-read under the lock: a question may have moved the conversation on
+                held, _ = await run_in_threadpool(context_store.for_conversation, user_id, conversation_id)
+                if held is None or held.context_id != context_id or held.version >= stored.version:
+                    continue
+                await push_context(conversation_id, conversation_url, held.content, stored.content)
+                # A conversation that wasn't reached keeps its version and gets the full difference next time
+                await run_in_threadpool(context_store.attach, user_id, conversation_id, stored, conversation_url)
+            updated.append(conversation_id)
+        except Exception as e:
+            logger.error("Error updating context for conversation %s: %s", conversation_id, e)
+    return {**stored.to_dict(), "conversations": updated}
+
+
+async def get_history(table: str, user_id: str, columns: str, limit: int, offset: int):
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(status_code=422, detail="limit must be 1-100 and offset >= 0")
+    try:
+        rows = await run_in_threadpool(
+            (await persistence.aget()).get_user_records,
+            table, user_id, columns.split(",") if columns else None, limit, offset
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error("Error retrieving %s: %s", table, str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"items": rows, "limit": limit, "offset": offset}
+
+
+@app.get("/history/uploads", response_class=JSONResponse)
+async def upload_history(limit: int = 20, offset: int = 0, columns: str = None, user_id: str = Depends(get_current_user)):
+    """
+    One page of the user's uploads, newest first. columns is a comma-separated projection.
+    """
+    return await get_history("uploads", user_id, columns, limit, offset)
+
+
+@app.get("/history/conversations", response_class=JSONResponse)
+async def conversation_history(limit: int = 20, offset: int = 0, columns: str = None, user_id: str = Depends(get_current_user)):
+    """
+    One page of the user's conversations, newest first. columns is a comma-separated projection.
+    """
+    return await get_history("conversations", user_id, columns, limit, offset)
+
+
 @app.get("/live", response_class=HTMLResponse)
 async def live(request: Request):
     conversation_url = request.cookies.get("conversation_url")
@@ -201,64 +1077,95 @@ async def health_check():
     return {"status": "ok", "message": "System is live and running."}
 
 
+@app.get("/startup", response_class=JSONResponse)
+async def startup_timings():
+    """
+    Import and init cost per component since process start.
+    """
+    return startup_report.as_dict()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms, token, chunk and
+    cache counters, and in-flight gauges.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats", response_class=JSONResponse)
+async def cache_stats():
+    """
+    Hit/miss counters for the document, chunk and OCR caches, used to size them.
+    """
+    return {"summary": await summary_cache.stats(), "chunk": await chunk_cache.stats(), "ocr": await ocr_cache.stats()}
+
+
+@app.get("/admission/stats", response_class=JSONResponse)
+async def admission_stats():
+    """
+    Running, queued, admitted and shed requests per admission class (this worker's
+    queue; running counts are host-wide with the SQLite backend).
+    """
+    return {"upload": await upload_admission.stats(), "conversation": await conversation_admission.stats()}
+
+
 @app.get("/test", response_class=JSONResponse)
 async def test_endpoint():
     return {"message": "CORS working!"}
 
 
-# @app.post("/record")
-# async def record(
-#     request: Request,
-#     file: UploadFile = File(...),
-#     description: str = Form(""),
-#     user_id: str = Depends(get_current_user)
-# ):
-#     print('Received record request from user: ', user_id)
-#     try:
-
-#         content = await file.read()
-#         logger.info(f"Content type: {type(content)}, size: {len(content)}")
-
-#         audio_array, _ = (
-#             ffmpeg
-#             .input('pipe:', format='webm')
-#             .output('pipe:', format='wav', acodec='pcm_s16le', ac=1, ar=16000)
-#             .run(input=content, capture_stdout=True, capture_stderr=True)
-#         )
-        
-#         audio_array = np.frombuffer(audio_array, np.int16).flatten().astype(np.float32) / 32768.0
-#         logger.info(f"Audio array shape: {audio_array.shape}, dtype: {audio_array.dtype}")
-
-#         # Transcribe directly from memory
-#         model = whisper.load_model("base")
-#         result = model.transcribe(audio_array)
-#         transcription = result["text"]
-        
-#         # Process with ChatGPT
-#         summary_prompt = PromptTemplate(
-#             template="""
-#                 Summarize the student's situation based on the following criteria:
-#                 1. What topic/subject they're studying
-#                 2. Their current progress/understanding level
-#                 3. Specific areas where they're struggling
-#                 4. Their confidence level with the material
-#                 Keep the response concise and empathetic and return in a cohesive paragraph.
-#                 \n\n{text}
-#             """,
-#             input_variables=["text"]
-#         )
-#         print('Prompt: ', summary_prompt)
-#         print('LLM: ', llm)
-#         response = llm.invoke(summary_prompt.format(text=transcription))
-#         print('LLM Response:', response)
-        
-#         return {"transcription": transcription, "analysis": response}
-        
-#     except Exception as e:
-#         logger.error(f"Error in /record: {str(e)}", exc_info=True)  # Add full error traceback
-#         raise HTTPException(status_code=500, detail=str(e))
+def build_record_prompt():
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        template="""
+            Summarize the student's situation based on the following criteria:
+            1. What topic/subject they're studying
+            2. Their current progress/understanding level
+            3. Specific areas where they're struggling
+            4. Their confidence level with the material
+            Keep the response concise and empathetic and return in a cohesive paragraph.
+            \n\n{text}
+        """,
+        input_variables=["text"]
+    )
+
+record_prompt = LazyComponent("record_prompt", build_record_prompt, startup_report)
+
+
+@app.post("/record")
+async def record(
+    request: Request,
+    file: UploadFile = File(...),
+    description: str = Form(""),
+    user_id: str = Depends(get_current_user)
+):
+    logger.info("Received record request from user: %s", user_id)
+    try:
+        content = await file.read()
+        logger.info("Recording size: %d bytes", len(content))
+
+        # Decoded and transcribed in memory by the shared, warm Whisper service
+        transcription = await transcription_service.transcribe_bytes(content)
+
+        prompt = (await record_prompt.aget()).format(text=transcription)
+        model = await llm.aget()
+        response = await llm_scheduler.run(lambda: model.ainvoke(prompt), len(prompt) // 4 + 400)
+
+        # The frontend reads analysis.content
+        return {"transcription": transcription, "analysis": {"content": response.content}}
+
+    except TranscriptionError as e:
+        logger.error("Error transcribing recording: %s", str(e))
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in /record: {str(e)}", exc_info=True)  # Add full error traceback
+        raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    import uvicorn
     logger.info("Starting FastAPI application.")
     # uvicorn.run(app, host="127.0.0.1", port=8090)
     # uvicorn.run(app, host="localhost", port=8000)
@@ -0,0 +1,192 @@
+# tests/test_admission.py
+import time
+import asyncio
+import pytest
+from utils.admission import AdmissionController, AdmissionRejected, MemoryAdmissionBackend, SQLiteAdmissionBackend
+
+
+def make_controller(backend=None, **kwargs) -> AdmissionController:
+    options = dict(max_concurrent=1, max_per_user=1, max_queue=8, max_queue_per_user=8, max_wait=1.0)
+    options.update(kwargs)
+    return AdmissionController("test", backend or MemoryAdmissionBackend(), **options)
+
+
+def test_cheaper_requests_are_admitted_first():
+    async def scenario():
+        controller = make_controller(max_per_user=8, cost_rate=1.0)
+        held = await controller.acquire("u1")
+        order = []
+
+        async def request(name, cost):
+            lease = await controller.acquire("u1", cost)
+            order.append(name)
+            await lease.release()
+
+        tasks = []
+        for name, cost in (("large", 30), ("small", 1), ("medium", 10)):
+            tasks.append(asyncio.create_task(request(name, cost)))
+            await asyncio.sleep(0.01)
+        await held.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["small", "medium", "large"]
+
+
+def test_a_user_at_their_cap_does_not_hold_back_others():
+    async def scenario():
+        controller = make_controller(max_concurrent=2)
+        held = await controller.acquire("u1")
+        queued = asyncio.create_task(controller.acquire("u1"))
+        other = await asyncio.wait_for(controller.acquire("u2"), 0.5)
+        await other.release()
+        await held.release()
+        await (await queued).release()
+        return await controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == 0 and stats["admitted"] == 3
+
+
+def test_timeout_is_shed_and_leaves_the_queue():
+    async def scenario():
+        controller = make_controller(max_wait=0.05)
+        held = await controller.acquire("u1")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("u2")
+        state = (len(controller._waiters), dict(controller._queued_by_user))
+        await held.release()
+        # The slot is free again for the next request
+        lease = await asyncio.wait_for(controller.acquire("u2"), 0.5)
+        await lease.release()
+        return rejected.value, state, await controller.stats()
+
+    rejected, state, stats = asyncio.run(scenario())
+    assert (rejected.reason, rejected.status_code) == ("timeout", 503)
+    assert state == (0, {})
+    assert stats["running"] == 0 and stats["rejected"] == {"timeout": 1}
+
+
+def test_disconnected_waiter_leaves_the_queue():
+    async def scenario():
+        controller = make_controller()
+        held = await controller.acquire("u1")
+        waiting = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        state = (len(controller._waiters), dict(controller._queued_by_user))
+        await held.release()
+        # The next request gets the slot rather than the waiter that went away
+        lease = await asyncio.wait_for(controller.acquire("u3"), 0.5)
+        running = (await controller.stats())["running"]
+        await lease.release()
+        return state, running, (await controller.stats())["running"]
+
+    state, running, after = asyncio.run(scenario())
+    assert state == (0, {})
+    assert (running, after) == (1, 0)
+
+
+def test_released_slot_goes_to_the_waiter():
+    async def scenario():
+        controller = make_controller()
+        held = await controller.acquire("u1")
+        waiting = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0.05)
+        await held.release()
+        lease = await asyncio.wait_for(waiting, 0.5)
+        await lease.release()
+        await lease.release()  # a second release is a no-op
+        return await controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["running"] == 0 and stats["admitted"] == 2
+
+
+def test_queue_and_rate_limits():
+    async def scenario():
+        controller = make_controller(max_queue=1, rate_per_minute=60, burst=3)
+        held = await controller.acquire("u1")
+        queued = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire("u3")
+        await held.release()
+        await (await queued).release()
+        with pytest.raises(AdmissionRejected) as limited:
+            for _ in range(3):
+                await (await controller.acquire("u1")).release()
+        return full.value, limited.value
+
+    full, limited = asyncio.run(scenario())
+    assert (full.reason, full.status_code) == ("queue_full", 503)
+    assert (limited.reason, limited.status_code) == ("rate_limited", 429)
+    assert limited.retry_after >= 1
+
+
+def test_per_user_limits_can_be_turned_off():
+    async def scenario():
+        controller = make_controller(max_concurrent=3, max_wait=0.05, rate_per_minute=1, burst=1,
+                                     max_queue_per_user=1, per_user=False)
+        # One user (the mock user) may use every slot; the global cap still holds
+        leases = [await asyncio.wait_for(controller.acquire("mock-user"), 0.5) for _ in range(3)]
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire("mock-user")
+        for lease in leases:
+            await lease.release()
+        return rejected.value
+
+    assert asyncio.run(scenario()).reason == "timeout"
+
+
+def test_sqlite_backend_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "admission.sqlite3")
+    # Two backends on one file stand in for two worker processes
+    first, second = SQLiteAdmissionBackend(path), SQLiteAdmissionBackend(path)
+    limits = {"upload:global": 2, "upload:user:u1": 1}
+
+    assert first.acquire("a", limits, ttl=60) is None
+    assert second.acquire("b", limits, ttl=60) == "upload:user:u1"
+    assert second.acquire("b", {"upload:global": 2, "upload:user:u2": 1}, ttl=60) is None
+    assert first.acquire("c", {"upload:global": 2, "upload:user:u3": 1}, ttl=60) == "upload:global"
+    assert second.in_use("upload:global") == 2
+    first.release("a")
+    assert second.in_use("upload:global") == 1 and second.in_use("upload:user:u1") == 0
+
+    # A worker that dies holding a slot doesn't leak it past the lease ttl
+    assert first.acquire("d", {"upload:global": 2}, ttl=0.05) is None
+    assert second.acquire("e", {"upload:global": 2}, ttl=60) == "upload:global"
+    time.sleep(0.1)
+    assert second.acquire("e", {"upload:global": 2}, ttl=60) is None
+
+    # Token buckets are shared too
+    assert first.take("upload:rate:u1", capacity=2, refill_per_second=1) == 0
+    assert second.take("upload:rate:u1", capacity=2, refill_per_second=1) == 0
+    assert first.take("upload:rate:u1", capacity=2, refill_per_second=1) > 0
+
+
+def test_controller_on_the_sqlite_backend(tmp_path):
+    async def scenario():
+        backend = SQLiteAdmissionBackend(str(tmp_path / "admission.sqlite3"))
+        controller = make_controller(backend, max_per_user=8, cost_rate=1.0, poll_interval=0.02)
+        held = await controller.acquire("u1")
+        order = []
+
+        async def request(name, cost):
+            lease = await controller.acquire("u1", cost)
+            order.append(name)
+            await lease.release()
+
+        tasks = []
+        for name, cost in (("large", 30), ("small", 1)):
+            tasks.append(asyncio.create_task(request(name, cost)))
+            await asyncio.sleep(0.01)
+        await held.release()
+        await asyncio.gather(*tasks)
+        return order, await controller.stats()
+
+    order, stats = asyncio.run(scenario())
+    assert order == ["small", "large"]
+    assert stats["running"] == 0
@@ -0,0 +1,68 @@
+# tests/test_context_store.py
+import pytest
+from utils.context_store import ContextStore, ContextNotFound, ContextConflict, context_delta
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ContextStore(str(tmp_path / "contexts.sqlite3"), max_versions=2)
+
+
+def test_create_deduplicates_per_user(store):
+    first = store.create("u1", "notes")
+    assert store.create("u1", "notes").context_id == first.context_id
+    assert store.create("u2", "notes").context_id != first.context_id
+    with pytest.raises(ContextNotFound):
+        store.get("u2", first.context_id)
+
+
+def test_fork_keeps_branches_apart(store):
+    base = store.create("u1", "notes")
+    a = store.fork("u1", base, "notes + recording")
+    b = store.fork("u1", base)
+    store.update("u1", a.context_id, "notes + recording + excerpt")
+
+    assert a.context_id != b.context_id != base.context_id
+    assert store.get("u1", a.context_id).content == "notes + recording + excerpt"
+    assert store.get("u1", b.context_id).content == "notes"
+    assert store.get("u1", base.context_id).version == 1
+    # A branch with the same text as an upload is never handed out by create()
+    assert store.create("u1", "notes").context_id == base.context_id
+
+
+def test_update_conflicts_and_identical_content(store):
+    base = store.create("u1", "v1")
+    previous, current = store.update("u1", base.context_id, "v2", base_version=1)
+    assert (previous.version, current.version) == (1, 2)
+    assert store.update("u1", base.context_id, "v2")[1].version == 2
+    with pytest.raises(ContextConflict):
+        store.update("u1", base.context_id, "v3", base_version=1)
+
+
+def test_attach_keeps_the_held_version(store):
+    branch = store.fork("u1", store.create("u1", "v1"))
+    store.attach("u1", "conv", branch, "https://rooms/conv")
+    for n in range(2, 7):
+        store.update("u1", branch.context_id, f"v1 {n}")
+
+    held, url = store.for_conversation("u1", "conv")
+    assert (held.version, held.content, url) == (1, "v1", "https://rooms/conv")
+    assert store.conversations("u1", branch.context_id) == [("conv", 1, "https://rooms/conv")]
+    assert store.for_conversation("u2", "conv") == (None, None)
+
+    # Older versions nobody holds are pruned; the latest max_versions stay
+    with pytest.raises(ContextNotFound):
+        store.get("u1", branch.context_id, 3)
+    assert store.get("u1", branch.context_id, 5).content == "v1 5"
+
+    latest = store.get("u1", branch.context_id)
+    store.attach("u1", "conv", latest)
+    held, url = store.for_conversation("u1", "conv")
+    assert (held.version, url) == (6, "https://rooms/conv")
+
+
+def test_context_delta():
+    assert context_delta("notes", "notes + excerpt") == ("append", " + excerpt")
+    assert context_delta("notes", "notes") == ("append", "")
+    assert context_delta("notes", "other") == ("overwrite", "other")
+    assert context_delta("", "notes") == ("overwrite", "notes")
@@ -0,0 +1,148 @@
+# tests/test_interactions.py
+import time
+import asyncio
+from utils.interactions import DailySessionManager
+
+
+class FakeCallClient:
+    """Stands in for daily.CallClient; send_delay simulates a slow app message."""
+
+    instances = []
+
+    def __init__(self, send_delay: float = 0):
+        self.send_delay = send_delay
+        self.joined = None
+        self.messages = []
+        self.released = False
+        FakeCallClient.instances.append(self)
+
+    def join(self, url):
+        self.joined = url
+
+    def send_app_message(self, message):
+        time.sleep(self.send_delay)
+        self.messages.append(message)
+
+    def leave(self):
+        self.joined = None
+
+    def release(self):
+        self.released = True
+
+
+def make_manager(send_delay: float = 0, **kwargs) -> DailySessionManager:
+    FakeCallClient.instances = []
+    return DailySessionManager(call_client_factory=lambda: FakeCallClient(send_delay), **kwargs)
+
+
+def sent(client: FakeCallClient) -> list:
+    return [(m["event_type"].split(".")[1], m["properties"]["context"]) for m in client.messages]
+
+
+def test_updates_in_one_window_are_coalesced():
+    async def scenario():
+        manager = make_manager(debounce=0.05)
+        await manager.start()
+        for version in ("v1", "v2", "v3"):
+            await manager.update_context("c1", "https://rooms/c1", version)
+        await asyncio.sleep(0.15)
+        await manager.aclose()
+        return manager
+
+    manager = asyncio.run(scenario())
+    [client] = FakeCallClient.instances
+    assert sent(client) == [("overwrite_llm_context", "v3")]
+    assert manager.stats()["coalesced"] == 2
+    assert client.released
+
+
+def test_appends_extend_the_pending_update():
+    async def scenario():
+        manager = make_manager(debounce=0.05)
+        await manager.update_context("c1", "https://rooms/c1", "base")
+        await manager.update_context("c1", "https://rooms/c1", " +a", mode="append")
+        await manager.update_context("c1", "https://rooms/c1", " +b", mode="append")
+        await asyncio.sleep(0.15)
+        await manager.update_context("c1", "https://rooms/c1", " +c", mode="append")
+        await manager.update_context("c1", "https://rooms/c1", " +d", mode="append")
+        await manager.aclose()
+
+    asyncio.run(scenario())
+    [client] = FakeCallClient.instances
+    assert sent(client) == [("overwrite_llm_context", "base +a +b"), ("append_llm_context", " +c +d")]
+
+
+def test_update_during_a_slow_send_is_delivered():
+    async def scenario():
+        manager = make_manager(send_delay=0.2, debounce=0.02)
+        await manager.update_context("c1", "https://rooms/c1", "v1")
+        await asyncio.sleep(0.1)  # v1 is being sent
+        await manager.update_context("c1", "https://rooms/c1", "v2")
+        await asyncio.sleep(0.5)
+        pending = dict(manager._pending)
+        await manager.aclose()
+        return pending
+
+    pending = asyncio.run(scenario())
+    [client] = FakeCallClient.instances
+    assert sent(client) == [("overwrite_llm_context", "v1"), ("overwrite_llm_context", "v2")]
+    assert pending == {}
+
+
+def test_one_session_per_conversation_and_idle_eviction():
+    async def scenario():
+        manager = make_manager(debounce=0.01, idle_timeout=0.05)
+        await manager.start()
+        await asyncio.gather(*[manager.get_session("c1", "https://rooms/c1") for _ in range(5)])
+        await manager.get_session("c2", "https://rooms/c2")
+        sessions = len(manager)
+        await asyncio.sleep(0.2)
+        remaining = len(manager)
+        await manager.aclose()
+        return sessions, remaining
+
+    sessions, remaining = asyncio.run(scenario())
+    assert sessions == 2
+    assert remaining == 0
+    assert len(FakeCallClient.instances) == 2
+    assert all(client.released for client in FakeCallClient.instances)
+
+
+def test_send_context_waits_for_delivery_and_raises_on_failure():
+    class FailingCallClient(FakeCallClient):
+        def send_app_message(self, message):
+            raise RuntimeError("room closed")
+
+    async def scenario():
+        manager = make_manager(debounce=0.02)
+        await manager.send_context("c1", "https://rooms/c1", "v1")
+        delivered = list(FakeCallClient.instances[0].messages)
+        await manager.aclose()
+
+        failing = DailySessionManager(call_client_factory=FailingCallClient, debounce=0.02)
+        try:
+            await failing.send_context("c2", "https://rooms/c2", "v1")
+        except RuntimeError as e:
+            error = str(e)
+        else:
+            error = None
+        await failing.aclose()
+        return delivered, error
+
+    delivered, error = asyncio.run(scenario())
+    assert [m["properties"]["context"] for m in delivered] == ["v1"]
+    assert error == "room closed"
+
+
+def test_coalesced_updates_share_one_delivery():
+    async def scenario():
+        manager = make_manager(debounce=0.05)
+        first = await manager.update_context("c1", "https://rooms/c1", "base")
+        second = await manager.update_context("c1", "https://rooms/c1", " +a", mode="append")
+        await second
+        done = first.done() and first.exception() is None
+        await manager.aclose()
+        return first is second, done
+
+    same, done = asyncio.run(scenario())
+    assert same and done
@@ -0,0 +1,141 @@
+# tests/test_persistence.py
+import asyncio
+import threading
+import pytest
+from utils.persistence import BatchWriter, SQLiteBackend, check_columns
+
+
+class RecordingBackend(SQLiteBackend):
+    """SQLiteBackend that remembers each batch it was given and the thread it ran on."""
+
+    def __init__(self, path: str, fail: bool = False):
+        super().__init__(path)
+        self.fail = fail
+        self.batches = []
+        self.threads = set()
+
+    def insert_many(self, table, rows):
+        self.threads.add(threading.current_thread())
+        if self.fail:
+            raise RuntimeError("database is locked")
+        self.batches.append((table, len(rows)))
+        super().insert_many(table, rows)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return RecordingBackend(str(tmp_path / "history.sqlite3"))
+
+
+def upload(n: int) -> dict:
+    return {"user_id": "u1", "file_url": f"https://bucket/{n}.pdf", "description": f"upload {n}"}
+
+
+def test_full_batch_is_flushed_without_waiting_for_the_interval(backend):
+    async def scenario():
+        writer = BatchWriter(lambda: backend, max_batch=3, flush_interval=10)
+        await writer.start()
+        for n in range(3):
+            writer.enqueue("uploads", upload(n))
+        await asyncio.sleep(0.1)
+        rows = len(backend.get_user_records("uploads", "u1"))
+        await writer.aclose()
+        return rows, writer.stats()
+
+    rows, stats = asyncio.run(scenario())
+    assert rows == 3
+    assert backend.batches == [("uploads", 3)]
+    assert stats == {"pending": 0, "written": 3, "dropped": 0}
+    assert threading.main_thread() not in backend.threads
+
+
+def test_partial_batch_is_flushed_on_the_interval(backend):
+    async def scenario():
+        writer = BatchWriter(lambda: backend, max_batch=50, flush_interval=0.05)
+        await writer.start()
+        writer.enqueue("uploads", upload(1))
+        writer.enqueue("conversations", {"user_id": "u1", "conversation_url": "https://rooms/c1", "context": "context:abc@1"})
+        before = len(backend.batches)
+        await asyncio.sleep(0.2)
+        after = sorted(backend.batches)
+        await writer.aclose()
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == 0
+    assert after == [("conversations", 1), ("uploads", 1)]
+
+
+def test_pending_rows_are_written_on_shutdown(backend):
+    async def scenario():
+        writer = BatchWriter(lambda: backend, max_batch=2, flush_interval=10)
+        await writer.start()
+        await asyncio.sleep(0)
+        for n in range(5):
+            writer.enqueue("uploads", upload(n))
+        # Nothing has had a chance to run yet; shutdown writes it all, max_batch at a time
+        await writer.aclose()
+        return writer.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats == {"pending": 0, "written": 5, "dropped": 0}
+    assert sum(size for _, size in backend.batches) == 5
+    assert max(size for _, size in backend.batches) == 2
+    assert len(backend.get_user_records("uploads", "u1", limit=100)) == 5
+
+
+def test_full_buffer_and_failed_writes_are_counted_as_dropped(tmp_path):
+    backend = RecordingBackend(str(tmp_path / "history.sqlite3"), fail=True)
+
+    async def scenario():
+        writer = BatchWriter(lambda: backend, max_batch=10, flush_interval=10, max_pending=2)
+        for n in range(3):
+            writer.enqueue("uploads", upload(n))
+        await writer.aclose()
+        return writer.stats()
+
+    assert asyncio.run(scenario()) == {"pending": 0, "written": 0, "dropped": 3}
+
+
+def test_backend_is_created_on_the_first_flush(backend):
+    created = []
+
+    def get_backend():
+        created.append(threading.current_thread())
+        return backend
+
+    async def scenario():
+        writer = BatchWriter(get_backend, flush_interval=10)
+        await writer.start()
+        started = list(created)
+        writer.enqueue("uploads", upload(1))
+        await writer.aclose()
+        return started
+
+    assert asyncio.run(scenario()) == []
+    assert created and threading.main_thread() not in created
+
+
+def test_check_columns():
+    check_columns("uploads", ["id", "file_url", "created_at"])
+    with pytest.raises(ValueError, match="password"):
+        check_columns("uploads", ["file_url", "password"])
+    # Columns of the other table aren't allowed either
+    with pytest.raises(ValueError):
+        check_columns("uploads", ["conversation_url"])
+
+
+def test_history_queries(backend):
+    backend.insert_many("uploads", [
+        {**upload(n), "user_id": "u1" if n % 2 else "u2", "created_at": float(n)} for n in range(6)
+    ])
+
+    rows = backend.get_user_records("uploads", "u1", ["file_url", "created_at"], limit=2)
+    assert rows == [
+        {"file_url": "https://bucket/5.pdf", "created_at": 5.0},
+        {"file_url": "https://bucket/3.pdf", "created_at": 3.0},
+    ]
+    assert [row["description"] for row in backend.get_user_records("uploads", "u1", offset=2)] == ["upload 1"]
+    assert set(backend.get_user_records("uploads", "u2")[0]) == {"id", "user_id", "file_url", "description", "created_at"}
+    with pytest.raises(ValueError):
+        backend.get_user_records("uploads", "u1", ["file_url; DROP TABLE uploads"])
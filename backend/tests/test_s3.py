@@ -0,0 +1,92 @@
+# tests/test_s3.py
+import io
+import os
+import gzip
+import asyncio
+import pytest
+from utils.utils import AWSClient, TextStream
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "test-bucket"
+MB = 1024 * 1024
+# Multibyte characters, so chunk boundaries fall inside UTF-8 sequences
+TEXT = "Überblick: Lösung für Aufgabe 3 — ½ + ¼ = ¾ ✓\n" * 20000
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_BUCKET_NAME", BUCKET)
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def make_client() -> AWSClient:
+    # 5 MB is the smallest part S3 accepts
+    return AWSClient(multipart_threshold=5 * MB, multipart_chunksize=5 * MB, max_concurrency=4)
+
+
+def fetch(s3, url: str) -> dict:
+    assert url.startswith(f"s3://{BUCKET}/")
+    return s3.get_object(Bucket=BUCKET, Key=url[len(f"s3://{BUCKET}/"):])
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_text_stream_round_trip(compress):
+    stream = io.BufferedReader(TextStream(TEXT, compress=compress, chunk_chars=1000), buffer_size=777)
+    body = stream.read()
+    assert (gzip.decompress(body) if compress else body).decode("utf-8") == TEXT
+    if compress:
+        assert len(body) < len(TEXT.encode("utf-8")) // 10
+
+
+def test_compressed_text_upload(s3):
+    url = make_client().save_text_to_s3(TEXT, "u1", compress=True)
+    stored = fetch(s3, url)
+    assert url.endswith(".txt.gz")
+    assert stored["ContentEncoding"] == "gzip"
+    assert stored["ContentType"] == "text/plain; charset=utf-8"
+    assert gzip.decompress(stored["Body"].read()).decode("utf-8") == TEXT
+
+
+def test_large_file_is_uploaded_in_parts(s3, tmp_path):
+    path = tmp_path / "scan.pdf"
+    data = os.urandom(12 * MB)
+    path.write_bytes(data)
+
+    url = make_client().upload_path_to_s3(str(path), "u1")
+    stored = fetch(s3, url)
+    assert url.startswith(f"s3://{BUCKET}/u1/") and url.endswith(".pdf")
+    assert stored["Body"].read() == data
+    # Multipart ETags end in -<number of parts>
+    assert stored["ETag"].strip('"').endswith("-3")
+
+    small = tmp_path / "notes.txt"
+    small.write_bytes(b"plain upload")
+    stored = fetch(s3, make_client().upload_path_to_s3(str(small), "u1"))
+    assert stored["Body"].read() == b"plain upload"
+    assert "-" not in stored["ETag"]
+
+
+def test_archive_batch_keeps_order_and_reports_failures(s3, tmp_path):
+    path = tmp_path / "homework.png"
+    path.write_bytes(b"\x89PNG...")
+    items = [
+        {"text": "summary"},
+        {"path": str(path)},
+        {"path": str(tmp_path / "missing.pdf")},
+        {"text": "transcript", "compress": False},
+    ]
+    client = make_client()
+    for results in (client.archive_batch(items, "u1"), asyncio.run(client.aarchive_batch(items, "u1"))):
+        assert isinstance(results[2], FileNotFoundError)
+        summary, image, _, transcript = results
+        assert gzip.decompress(fetch(s3, summary)["Body"].read()) == b"summary"
+        assert image.endswith(".png") and fetch(s3, image)["Body"].read() == b"\x89PNG..."
+        assert transcript.endswith(".txt") and fetch(s3, transcript)["Body"].read() == b"transcript"
@@ -0,0 +1,36 @@
+# tests/test_startup.py
+import time
+import asyncio
+import threading
+from utils.startup import LazyComponent, StartupReport
+
+
+def test_aget_builds_once_off_the_event_loop():
+    built_on = []
+
+    def factory():
+        built_on.append(threading.current_thread())
+        time.sleep(0.1)
+        return object()
+
+    async def scenario():
+        component = LazyComponent("slow", factory, StartupReport())
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        values = await asyncio.gather(*[component.aget() for _ in range(3)])
+        task.cancel()
+        return component, values, ticks
+
+    component, values, ticks = asyncio.run(scenario())
+    assert len(built_on) == 1 and built_on[0] is not threading.main_thread()
+    assert values[0] is values[1] is values[2] is component.get()
+    # The loop kept running while the factory slept
+    assert ticks >= 5
+    assert [entry["component"] for entry in component.report.entries] == ["slow"]
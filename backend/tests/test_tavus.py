@@ -0,0 +1,105 @@
+# tests/test_tavus.py
+import asyncio
+import httpx
+import pytest
+from bench.fakes import TavusStubServer
+from utils.utils import AsyncTavusClient
+
+
+@pytest.fixture
+def stub():
+    server = TavusStubServer(latency=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def credentials(monkeypatch):
+    monkeypatch.setenv("TAVUS_API_KEY", "test-key")
+    monkeypatch.setenv("REPLICA_ID", "r1")
+    monkeypatch.setenv("PERSONA_ID", "p1")
+
+
+def make_client(base_url: str, **kwargs) -> tuple:
+    """A client that records the backoff delay it chooses before each retry."""
+    client = AsyncTavusClient(base_url=base_url, backoff_base=0.01, backoff_max=0.05, **kwargs)
+    delays = []
+    backoff = client._backoff
+
+    def recording_backoff(attempt, response=None):
+        delays.append(backoff(attempt, response))
+        return delays[-1]
+
+    client._backoff = recording_backoff
+    return client, delays
+
+
+def call(client, method: str, *args):
+    async def scenario():
+        try:
+            return await getattr(client, method)(*args)
+        finally:
+            await client.aclose()
+    return asyncio.run(scenario())
+
+
+def test_get_retries_5xx_with_growing_backoff(stub):
+    stub.faults = [503, 502, 500]
+    client, delays = make_client(stub.base_url)
+    assert call(client, "get_replica") == {"status": "ok"}
+    assert [method for method, _ in stub.received] == ["GET"] * 4
+    assert len(delays) == 3
+    # Full jitter: each delay is drawn from [0, base * 2^attempt], capped at backoff_max
+    assert all(0 <= delay <= min(0.05, 0.01 * 2 ** attempt) for attempt, delay in enumerate(delays))
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.faults = [503] * 3
+    client, delays = make_client(stub.base_url, max_retries=2)
+    with pytest.raises(httpx.HTTPStatusError):
+        call(client, "get_replica")
+    assert len(stub.received) == 3 and len(delays) == 2
+
+
+def test_post_retries_429_honouring_retry_after(stub):
+    stub.faults = [429]
+    client, delays = make_client(stub.base_url)
+    url = call(client, "create_conversation", "context")
+    assert url.startswith("https://tavus.daily.co/")
+    assert [method for method, _ in stub.received] == ["POST", "POST"]
+    # Retry-After: 1, capped at backoff_max
+    assert delays == [0.05]
+
+
+def test_post_is_not_replayed_after_the_server_received_it(stub):
+    stub.faults = [503]
+    client, _ = make_client(stub.base_url)
+    with pytest.raises(httpx.HTTPStatusError):
+        call(client, "create_conversation", "context")
+    assert stub.received == [("POST", "/v2/conversations")]
+
+    stub.received.clear()
+    stub.faults = ["drop"]
+    client, _ = make_client(stub.base_url)
+    with pytest.raises(httpx.TransportError):
+        call(client, "create_conversation", "context")
+    assert stub.received == [("POST", "/v2/conversations")]
+
+
+def test_idempotent_requests_are_retried_after_a_dropped_connection(stub):
+    stub.faults = ["drop"]
+    client, delays = make_client(stub.base_url)
+    assert call(client, "update_conversation_context", "c1", "new context") == {"status": "ok"}
+    assert [method for method, _ in stub.received] == ["PATCH", "PATCH"]
+    assert len(delays) == 1
+
+
+def test_post_is_retried_when_the_connection_was_never_made():
+    # Nothing listens on the port of a closed server
+    server = TavusStubServer(latency=0)
+    base_url = server.base_url
+    server._server.server_close()
+    client, delays = make_client(base_url, max_retries=2)
+    with pytest.raises(httpx.ConnectError):
+        call(client, "create_conversation", "context")
+    assert len(delays) == 2
@@ -0,0 +1,476 @@
+# utils/admission.py
+import json
+import math
+import time
+import uuid
+import heapq
+import asyncio
+import sqlite3
+import logging
+import itertools
+import threading
+from collections import OrderedDict, Counter
+from utils.sqlite import SQLiteStore
+from utils.ratelimit import TokenBucket
+from utils.metrics import ADMISSION_WAIT_SECONDS, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, status_code: int, retry_after: float, detail: str):
+        """
+        A request shed by admission control; retry_after (seconds) becomes the Retry-After header.
+        """
+        super().__init__(detail)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionBackend:
+    """
+    Rate-limit buckets and concurrency slots behind an AdmissionController.
+    """
+
+    def take(self, key: str, capacity: float, refill_per_second: float, amount: float = 1) -> float:
+        """
+        Take amount tokens from the bucket at key. Returns 0 on success, otherwise
+        the seconds until they would be available.
+        """
+        raise NotImplementedError
+
+    def acquire(self, lease_id: str, limits: dict, ttl: float) -> str:
+        """
+        Hold one slot under every key of limits ({key: max slots}) at once.
+        Returns None on success, otherwise the first key that is full.
+        """
+        raise NotImplementedError
+
+    def release(self, lease_id: str) -> None:
+        raise NotImplementedError
+
+    def in_use(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class MemoryAdmissionBackend(AdmissionBackend):
+    def __init__(self, max_buckets: int = 10000):
+        """
+        In-process state: limits apply per worker process.
+        """
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._leases = {}
+        self._in_use = Counter()
+
+    def take(self, key: str, capacity: float, refill_per_second: float, amount: float = 1) -> float:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(capacity, refill_per_second)
+                if len(self._buckets) > self.max_buckets:
+                    # The least recently used bucket goes; it has most likely refilled anyway
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            if bucket.try_acquire(amount):
+                return 0.0
+            return bucket.time_until(amount)
+
+    def acquire(self, lease_id: str, limits: dict, ttl: float) -> str:
+        with self._lock:
+            for key, limit in limits.items():
+                if self._in_use[key] >= limit:
+                    return key
+            for key in limits:
+                self._in_use[key] += 1
+            self._leases[lease_id] = list(limits)
+            return None
+
+    def release(self, lease_id: str) -> None:
+        with self._lock:
+            for key in self._leases.pop(lease_id, []):
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+
+    def in_use(self, key: str) -> int:
+        with self._lock:
+            return self._in_use[key]
+
+
+class SQLiteAdmissionBackend(SQLiteStore, AdmissionBackend):
+    # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+    connect_options = {"isolation_level": None}
+
+    def __init__(self, path: str):
+        """
+        State in a SQLite file so the limits hold across every worker process on
+        the host. Slots are leases that expire after their ttl, so a worker that
+        dies holding one does not leak it.
+        """
+        super().__init__(path)
+        self._takes = 0
+
+    def _setup(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS admission_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS admission_leases ("
+            "lease_id TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (lease_id, key))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS admission_leases_key ON admission_leases (key)")
+
+    def _transaction(self, work):
+        # One write transaction at a time across processes, so check-and-take is atomic
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def take(self, key: str, capacity: float, refill_per_second: float, amount: float = 1) -> float:
+        amount = min(amount, capacity)
+
+        def work(db):
+            now = time.time()
+            self._takes += 1
+            if self._takes % 256 == 0:
+                # Buckets that have refilled are the same as missing ones
+                db.execute("DELETE FROM admission_buckets WHERE full_at < ?", (now,))
+            row = db.execute("SELECT tokens, updated_at FROM admission_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill_per_second)
+            wait = 0.0
+            if tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) / refill_per_second
+            db.execute(
+                "INSERT OR REPLACE INTO admission_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / refill_per_second)
+            )
+            return wait
+
+        return self._transaction(work)
+
+    def acquire(self, lease_id: str, limits: dict, ttl: float) -> str:
+        def work(db):
+            now = time.time()
+            db.execute("DELETE FROM admission_leases WHERE expires_at < ?", (now,))
+            for key, limit in limits.items():
+                if db.execute("SELECT COUNT(*) FROM admission_leases WHERE key = ?", (key,)).fetchone()[0] >= limit:
+                    return key
+            db.executemany(
+                "INSERT INTO admission_leases (lease_id, key, expires_at) VALUES (?, ?, ?)",
+                [(lease_id, key, now + ttl) for key in limits]
+            )
+            return None
+
+        return self._transaction(work)
+
+    def release(self, lease_id: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM admission_leases WHERE lease_id = ?", (lease_id,))
+
+    def in_use(self, key: str) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM admission_leases WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()[0]
+
+
+def build_admission_backend(kind: str = "memory", path: str = None) -> AdmissionBackend:
+    """
+    Create an admission backend by name: "memory" (per process) or "sqlite" (shared by the host's workers).
+    """
+    if kind == "memory":
+        return MemoryAdmissionBackend()
+    if kind == "sqlite":
+        return SQLiteAdmissionBackend(path or "data/admission.sqlite3")
+    raise ValueError(f"Unknown admission backend: {kind}")
+
+
+class Lease:
+    def __init__(self, controller: "AdmissionController", lease_id: str):
+        self.controller = controller
+        self.lease_id = lease_id
+        self.granted_at = time.monotonic()
+        self._released = False
+
+    async def release(self) -> None:
+        if not self._released:
+            self._released = True
+            await self.controller._release(self)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        backend: AdmissionBackend,
+        max_concurrent: int = 8,
+        max_per_user: int = 2,
+        rate_per_minute: float = 0,
+        burst: float = None,
+        max_queue: int = 64,
+        max_queue_per_user: int = 4,
+        max_wait: float = 30.0,
+        cost_rate: float = None,
+        lease_ttl: float = 900.0,
+        poll_interval: float = 0.25,
+        per_user: bool = True
+    ):
+        """
+        Admission for one class of expensive requests. Each user has a token bucket
+        (rate_per_minute, burst) and at most max_per_user requests running; at most
+        max_concurrent run overall. Requests over a concurrency cap wait in a priority
+        queue: a waiter's place is its arrival time plus cost / cost_rate seconds, so
+        small uploads overtake large ones without starving them. Requests are shed with
+        a Retry-After when the user is over their rate, the queue is full, or they
+        waited longer than max_wait. Backend calls run in a thread (SQLite may wait on
+        other workers' locks), and one dispatcher task per controller hands out slots.
+        With per_user=False the rate limit and the per-user caps are off and only the
+        global cap and the queue apply.
+        """
+        self.name = name
+        self.backend = backend
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst or max(1.0, rate_per_minute / 6)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self.cost_rate = cost_rate
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.per_user = per_user
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._queued_by_user = Counter()
+        self._service_time = None
+        self._dispatcher = None
+        self._wakeup = None
+        self.admitted = 0
+        self.rejected = Counter()
+
+    def _limits(self, user_id: str) -> dict:
+        limits = {f"{self.name}:global": self.max_concurrent}
+        if self.per_user:
+            limits[f"{self.name}:user:{user_id}"] = self.max_per_user
+        return limits
+
+    def _reject(self, reason: str, status_code: int, retry_after: float, detail: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.labels(endpoint=self.name, reason=reason).inc()
+        logger.warning("Admission (%s) rejected request: %s", self.name, detail)
+        raise AdmissionRejected(reason, status_code, max(1.0, retry_after), detail)
+
+    def estimated_wait(self, ahead: int) -> float:
+        """
+        Rough seconds until a request queued behind `ahead` others starts,
+        from the recent average time a slot is held.
+        """
+        return (self._service_time or 1.0) * (ahead + 1) / self.max_concurrent
+
+    def _remove(self, entry: tuple) -> None:
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+
+    def _wake(self) -> None:
+        """
+        Have the dispatcher run a pass now, starting it if waiters are queued.
+        """
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._waiters and (self._dispatcher is None or self._dispatcher.done()):
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._run_dispatcher())
+
+    async def _run_dispatcher(self) -> None:
+        # Runs while anyone is queued: a pass right after each arrival or release in
+        # this process, and every poll_interval to pick up slots freed by other
+        # worker processes (shared backend)
+        try:
+            while self._waiters:
+                self._wakeup.clear()
+                try:
+                    await self._dispatch()
+                except Exception as e:
+                    logger.error("Admission (%s) dispatch failed: %s", self.name, e)
+                if self._waiters:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self._dispatcher = None
+
+    async def _dispatch(self) -> None:
+        """
+        Grant slots to waiters in priority order. A waiter whose user is at their
+        cap is skipped (with the rest of that user's waiters), so it doesn't hold
+        back other users; a full global cap stops the pass.
+        """
+        global_key = f"{self.name}:global"
+        blocked_users = set()
+        for entry in sorted(self._waiters):
+            future, user_id, lease_id = entry[2:]
+            if future.done() or user_id in blocked_users:
+                continue
+            blocked = await asyncio.to_thread(self.backend.acquire, lease_id, self._limits(user_id), self.lease_ttl)
+            if blocked is None:
+                self._remove(entry)
+                if future.done():
+                    # The waiter gave up while its slot was being taken
+                    await asyncio.to_thread(self.backend.release, lease_id)
+                else:
+                    future.set_result(Lease(self, lease_id))
+            elif blocked == global_key:
+                break
+            else:
+                blocked_users.add(user_id)
+
+    async def acquire(self, user_id: str, cost: float = 0) -> Lease:
+        """
+        Wait for a slot and return its Lease; await lease.release() when the work is done.
+        Raises AdmissionRejected when the request is shed.
+        """
+        if self.per_user and self.rate_per_minute:
+            wait = await asyncio.to_thread(
+                self.backend.take, f"{self.name}:rate:{user_id}", self.burst, self.rate_per_minute / 60
+            )
+            if wait > 0:
+                self._reject("rate_limited", 429, wait, f"Too many {self.name} requests, retry in {math.ceil(wait)}s")
+        if self.per_user and self._queued_by_user[user_id] >= self.max_queue_per_user:
+            self._reject("user_queue_full", 429, self.estimated_wait(self._queued_by_user[user_id]),
+                         f"Too many queued {self.name} requests for this user")
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full", 503, self.estimated_wait(len(self._waiters)),
+                         f"Server busy: {len(self._waiters)} {self.name} requests queued")
+
+        start = time.monotonic()
+        priority = start + (cost / self.cost_rate if self.cost_rate else 0)
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future, user_id, uuid.uuid4().hex)
+        heapq.heappush(self._waiters, entry)
+        self._queued_by_user[user_id] += 1
+        queued = ADMISSION_QUEUED.labels(endpoint=self.name)
+        queued.inc()
+        try:
+            self._wake()
+            try:
+                lease = await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+            except asyncio.TimeoutError:
+                if not future.cancel():
+                    # Granted right at the deadline
+                    lease = future.result()
+                else:
+                    self._remove(entry)
+                    self._reject("timeout", 503, self.estimated_wait(len(self._waiters)),
+                                 f"Server busy: waited {self.max_wait:g}s for a {self.name} slot")
+        except BaseException:
+            if not future.cancel() and not future.cancelled():
+                # Granted just as the caller gave up (client disconnected)
+                await future.result().release()
+            self._remove(entry)
+            raise
+        finally:
+            queued.dec()
+            self._queued_by_user[user_id] -= 1
+            if not self._queued_by_user[user_id]:
+                del self._queued_by_user[user_id]
+
+        waited = time.monotonic() - start
+        ADMISSION_WAIT_SECONDS.labels(endpoint=self.name).observe(waited)
+        self.admitted += 1
+        if waited > 1:
+            logger.info("Admitted %s request for %s after %.2fs in queue", self.name, user_id, waited)
+        return lease
+
+    async def _release(self, lease: Lease) -> None:
+        held = time.monotonic() - lease.granted_at
+        self._service_time = held if self._service_time is None else 0.8 * self._service_time + 0.2 * held
+        await asyncio.to_thread(self.backend.release, lease.lease_id)
+        self._wake()
+
+    async def stats(self) -> dict:
+        return {
+            "running": await asyncio.to_thread(self.backend.in_use, f"{self.name}:global"),
+            "max_concurrent": self.max_concurrent,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_seconds": self._service_time,
+        }
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, routes: dict, user_resolver, enabled: bool = True):
+        """
+        ASGI middleware admitting requests to the routes in routes
+        ({(method, path): (controller, cost_fn)}) before their body is read.
+        cost_fn(request) gives the queue cost, e.g. the upload size. The slot is held
+        until the response (including a streamed body) has been sent, unless the
+        handler takes it over with take_lease().
+        """
+        self.app = app
+        self.routes = routes
+        self.user_resolver = user_resolver
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        route = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route is None or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        from starlette.requests import Request
+        controller, cost_fn = route
+        request = Request(scope)
+        try:
+            lease = await controller.acquire(self.user_resolver(request), cost_fn(request) if cost_fn else 0)
+        except AdmissionRejected as e:
+            body = json.dumps({"detail": str(e), "reason": e.reason}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": e.status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(math.ceil(e.retry_after)).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        scope.setdefault("state", {})["admission_lease"] = lease
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["state"].get("admission_lease") is lease:
+                await lease.release()
+
+
+def take_lease(request) -> Lease:
+    """
+    Take over the request's admission slot so it outlives the response (e.g. until a
+    background job has run); the caller must release it. None if the route isn't admitted.
+    """
+    return request.scope.get("state", {}).pop("admission_lease", None)
+
+
+def content_length(request) -> int:
+    """Queue cost of an upload: its declared size in bytes."""
+    try:
+        return int(request.headers.get("content-length", 0))
+    except ValueError:
+        return 0
@@ -0,0 +1,261 @@
+# utils/cache.py
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from utils.sqlite import SQLiteStore
+from utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def hash_bytes(data: bytes) -> str:
+    """Return the SHA-256 hex digest of a byte string."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_fingerprint(config: dict) -> str:
+    """
+    Stable short hash of a configuration dict (model, chain type, splitter settings...).
+    Changing any value invalidates every cache entry derived from it.
+    """
+    encoded = json.dumps(config, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class CacheBackend:
+    """
+    Minimal key/value interface shared by the cache backends.
+    Values must be JSON serializable.
+    """
+
+    def get(self, key: str):
+        raise NotImplementedError
+
+    def set(self, key: str, value) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    async def call(self, func, *args):
+        """Run one of this backend's methods from async code; in-process backends run inline."""
+        return func(*args)
+
+
+class LRUCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = None, max_bytes: int = None):
+        """
+        In-process LRU cache with an entry limit, an optional size limit (values are
+        measured by their JSON length) and an optional TTL. A value larger than
+        max_bytes on its own is not stored.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _pop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at, _ = entry
+            if self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value) -> None:
+        size = len(json.dumps(value)) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                logger.debug("Not caching %s: %d bytes is over the %d byte limit", key, size, self.max_bytes)
+                return
+            self._entries[key] = (value, time.time(), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                evicted = next(iter(self._entries))
+                self._pop(evicted)
+                logger.debug("Evicted cache entry: %s", evicted)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Hits whose access times are buffered before they are written out
+ACCESS_FLUSH_SIZE = 256
+
+
+class SQLiteCacheBackend(SQLiteStore, CacheBackend):
+    def __init__(self, path: str, max_entries: int = None, ttl_seconds: float = None, table: str = "cache"):
+        """
+        On-disk cache stored in a single SQLite file so entries survive restarts
+        and are shared by every worker process on the host. Several caches can share
+        the file, one table each. Hits don't write: their access times are kept in
+        memory and stored with the next write.
+        """
+        super().__init__(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._touched = {}
+
+    def _setup(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _store_access_times(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds is not None and now - stored_at > self.ttl_seconds:
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= ACCESS_FLUSH_SIZE:
+                # Read-mostly workloads still get their access times stored now and then
+                self._store_access_times()
+                self._db.commit()
+        return json.loads(value)
+
+    def set(self, key: str, value) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._touched.pop(key, None)
+            self._store_access_times()
+            if self.max_entries is not None:
+                self._db.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table}")
+            self._db.commit()
+            self._touched.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+def build_cache_backend(kind: str = "memory", path: str = None, max_entries: int = 1024, ttl_seconds: float = None,
+                        max_bytes: int = None, table: str = "cache") -> CacheBackend:
+    """
+    Create a cache backend by name: "memory" (LRU, bounded by entries and max_bytes)
+    or "sqlite" (persistent file, bounded by entries; table names the cache in the file).
+    """
+    if kind == "memory":
+        return LRUCacheBackend(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes)
+    if kind == "sqlite":
+        return SQLiteCacheBackend(path or "cache/summary_cache.sqlite3", max_entries=max_entries, ttl_seconds=ttl_seconds, table=table)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class SummaryCache:
+    def __init__(self, backend: CacheBackend, config: dict = None, namespace: str = "summary"):
+        """
+        Content-addressed cache for processed documents.
+        Keys combine the SHA-256 of the uploaded bytes with a fingerprint of the chain/model config.
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.fingerprint = config_fingerprint(config or {})
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, digest: str) -> str:
+        return f"{self.namespace}:{self.fingerprint}:{digest}"
+
+    async def get(self, digest: str):
+        try:
+            value = await self.backend.call(self.backend.get, self.make_key(digest))
+        except Exception as e:
+            logger.error("Cache lookup failed: %s", e)
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        CACHE_LOOKUPS.labels(namespace=self.namespace, result="miss" if value is None else "hit").inc()
+        return value
+
+    async def set(self, digest: str, value) -> None:
+        try:
+            await self.backend.call(self.backend.set, self.make_key(digest), value)
+        except Exception as e:
+            logger.error("Cache write failed: %s", e)
+
+    async def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "backend": type(self.backend).__name__,
+            "entries": await self.backend.call(len, self.backend),
+            "bytes": getattr(self.backend, "size_bytes", None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,117 @@
+# utils/context.py
+import re
+import math
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"[A-Za-z0-9]+")
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+
+class TokenCounter:
+    def __init__(self, model: str = "gpt-4o-mini"):
+        """
+        Count tokens with tiktoken when available, otherwise estimate ~4 characters per token.
+        """
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except Exception as e:
+                # The encoding file is downloaded on first use; stay usable offline
+                logger.warning("Could not load tiktoken encoding, estimating tokens: %s", e)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return math.ceil(len(text) / 4)
+
+    def count_many(self, texts: list) -> list:
+        """
+        Token counts for many texts at once (batched encoding on tiktoken's thread pool).
+        """
+        if self.encoding is not None:
+            return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+        return [math.ceil(len(text) / 4) for text in texts]
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.encoding is not None:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return text
+            return self.encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+
+
+def relevance_scores(query: str, passages: list) -> list:
+    """
+    Score passages by weighted term overlap with the query (length-normalized).
+    """
+    query_terms = Counter(word.lower() for word in WORD_RE.findall(query))
+    scores = []
+    for passage in passages:
+        words = [word.lower() for word in WORD_RE.findall(passage)]
+        if not words:
+            scores.append(0.0)
+            continue
+        overlap = sum(query_terms[word] for word in words if word in query_terms)
+        scores.append(overlap / math.sqrt(len(words)))
+    return scores
+
+
+class ContextBuilder:
+    def __init__(self, token_budget: int = 8000, counter: TokenCounter = None):
+        """
+        Packs the user's name, the document summary and the most relevant page text
+        into a fixed token budget for the Tavus conversational context.
+        """
+        self.token_budget = token_budget
+        self.counter = counter or TokenCounter()
+
+    def build(self, name: str, summary: str = None, pages: list = None) -> str:
+        context = f"User Name: {name}\n"
+        if summary is None and not pages:
+            return context
+
+        remaining = self.token_budget - self.counter.count(context)
+
+        if summary:
+            section = f"# Document Summary:\n{summary}\n"
+            section = self.counter.truncate(section, remaining)
+            context += section
+            remaining -= self.counter.count(section)
+
+        pages = pages or []
+        header = "# Document Raw Content:\n"
+        remaining -= self.counter.count(header)
+        if remaining <= 0 or not any(page.strip() for page in pages):
+            return context
+
+        # Pick pages in relevance order until the budget runs out, then emit them in page order
+        scores = relevance_scores(summary or "", pages)
+        ranked = sorted(range(len(pages)), key=lambda i: (-scores[i], i))
+        selected = {}
+        for i in ranked:
+            text = pages[i].strip()
+            if not text or remaining <= 0:
+                continue
+            section = f"## Page {i + 1}\n{text}\n"
+            cost = self.counter.count(section)
+            if cost > remaining:
+                section = self.counter.truncate(section, remaining)
+                cost = remaining
+            selected[i] = section
+            remaining -= cost
+
+        logger.info("Context includes %d of %d pages", len(selected), len(pages))
+        return context + header + "".join(selected[i] for i in sorted(selected))
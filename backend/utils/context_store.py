@@ -0,0 +1,201 @@
+# utils/context_store.py
+import time
+import uuid
+import zlib
+import sqlite3
+import hashlib
+import logging
+from dataclasses import dataclass
+from utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class ContextNotFound(KeyError):
+    """Raised when a context (or version) does not exist or belongs to another user."""
+
+
+class ContextConflict(Exception):
+    """Raised when an update is based on a version that is no longer the latest."""
+
+
+@dataclass
+class ContextVersion:
+    context_id: str
+    version: int
+    content: str
+
+    def to_dict(self) -> dict:
+        return {"context_id": self.context_id, "version": self.version}
+
+
+def context_delta(old: str, new: str) -> tuple:
+    """
+    What a live conversation needs to go from old to new: ("append", suffix) when
+    new only adds text at the end (e.g. retrieved excerpts), otherwise ("overwrite", new).
+    """
+    if old and new.startswith(old):
+        return "append", new[len(old):]
+    return "overwrite", new
+
+
+class ContextStore(SQLiteStore):
+    def __init__(self, path: str, max_versions: int = 20, compress_level: int = 6):
+        """
+        Versioned conversation contexts per user, stored zlib-compressed in SQLite so
+        every worker process sees them. Clients keep a context_id instead of sending
+        the full text back; each update adds a version (identical content is not stored
+        twice). Each conversation gets its own branch, forked from the context it
+        was started with, so questions and updates in one conversation never show
+        up in another. Every live conversation records the version it was last
+        sent, so only the difference has to reach it. The first version and the
+        latest max_versions are kept.
+        """
+        super().__init__(path)
+        self.max_versions = max_versions
+        self.compress_level = compress_level
+
+    def _setup(self, db: sqlite3.Connection) -> None:
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS contexts (context_id TEXT NOT NULL, version INTEGER NOT NULL, "
+            "user_id TEXT NOT NULL, content BLOB NOT NULL, digest TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (context_id, version))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS contexts_digest ON contexts (user_id, digest)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS context_branches (context_id TEXT PRIMARY KEY, "
+            "parent_id TEXT NOT NULL, parent_version INTEGER NOT NULL)"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS context_conversations (conversation_id TEXT PRIMARY KEY, "
+            "context_id TEXT NOT NULL, version INTEGER NOT NULL, user_id TEXT NOT NULL, conversation_url TEXT)"
+        )
+
+    def _latest(self, user_id: str, context_id: str) -> tuple:
+        row = self._db.execute(
+            "SELECT version, content, digest FROM contexts WHERE context_id = ? AND user_id = ? "
+            "ORDER BY version DESC LIMIT 1",
+            (context_id, user_id)
+        ).fetchone()
+        if row is None:
+            raise ContextNotFound(context_id)
+        return row
+
+    def _insert(self, user_id: str, context_id: str, version: int, content: str, digest: str) -> None:
+        self._db.execute(
+            "INSERT INTO contexts (context_id, version, user_id, content, digest, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (context_id, version, user_id, zlib.compress(content.encode("utf-8"), self.compress_level), digest, time.time())
+        )
+        # Keep the root version (the upload's context), the most recent ones and
+        # whatever a live conversation still holds
+        self._db.execute(
+            "DELETE FROM contexts WHERE context_id = ? AND version > 1 AND version <= ? AND version NOT IN "
+            "(SELECT version FROM context_conversations WHERE context_id = ?)",
+            (context_id, version - self.max_versions, context_id)
+        )
+        self._db.commit()
+
+    def create(self, user_id: str, content: str) -> ContextVersion:
+        """
+        Store a new context. The same user storing the same text again (a repeated
+        upload, a job polled twice) gets the existing context back.
+        """
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT context_id FROM contexts WHERE user_id = ? AND digest = ? AND version = 1 "
+                "AND context_id NOT IN (SELECT context_id FROM context_branches)",
+                (user_id, digest)
+            ).fetchone()
+            if row is not None:
+                return ContextVersion(row[0], 1, content)
+            context_id = uuid.uuid4().hex
+            self._insert(user_id, context_id, 1, content, digest)
+        logger.info("Stored context %s (%d chars)", context_id, len(content))
+        return ContextVersion(context_id, 1, content)
+
+    def fork(self, user_id: str, base: ContextVersion, content: str = None) -> ContextVersion:
+        """
+        Start a new branch from base (a version the user owns) whose first version is
+        content, or a copy of base. Branches are never shared by create().
+        """
+        content = base.content if content is None else content
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        context_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO context_branches (context_id, parent_id, parent_version) VALUES (?, ?, ?)",
+                (context_id, base.context_id, base.version)
+            )
+            self._insert(user_id, context_id, 1, content, digest)
+        logger.info("Forked context %s@%d as %s", base.context_id, base.version, context_id)
+        return ContextVersion(context_id, 1, content)
+
+    def get(self, user_id: str, context_id: str, version: int = None) -> ContextVersion:
+        with self._lock:
+            if version is None:
+                version, content, _ = self._latest(user_id, context_id)
+            else:
+                row = self._db.execute(
+                    "SELECT content FROM contexts WHERE context_id = ? AND user_id = ? AND version = ?",
+                    (context_id, user_id, version)
+                ).fetchone()
+                if row is None:
+                    raise ContextNotFound(f"{context_id}@{version}")
+                content = row[0]
+        return ContextVersion(context_id, version, zlib.decompress(content).decode("utf-8"))
+
+    def update(self, user_id: str, context_id: str, content: str, base_version: int = None) -> tuple:
+        """
+        Store content as a new version and return (previous, current) ContextVersions.
+        With base_version, the update is rejected if another one landed in between.
+        """
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            version, previous, previous_digest = self._latest(user_id, context_id)
+            if base_version is not None and base_version != version:
+                raise ContextConflict(f"Context {context_id} is at version {version}, not {base_version}")
+            previous = ContextVersion(context_id, version, zlib.decompress(previous).decode("utf-8"))
+            if digest == previous_digest:
+                return previous, previous
+            self._insert(user_id, context_id, version + 1, content, digest)
+        return previous, ContextVersion(context_id, version + 1, content)
+
+    def attach(self, user_id: str, conversation_id: str, version: ContextVersion, conversation_url: str = None) -> None:
+        """
+        Record that a live conversation now holds this context version.
+        """
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO context_conversations (conversation_id, context_id, version, user_id, conversation_url) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT (conversation_id) DO UPDATE SET "
+                "context_id = excluded.context_id, version = excluded.version, "
+                "conversation_url = COALESCE(excluded.conversation_url, conversation_url)",
+                (conversation_id, version.context_id, version.version, user_id, conversation_url)
+            )
+            self._db.commit()
+
+    def for_conversation(self, user_id: str, conversation_id: str) -> tuple:
+        """
+        Return (ContextVersion the conversation holds, conversation_url), or (None, None).
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT context_id, version, conversation_url FROM context_conversations "
+                "WHERE conversation_id = ? AND user_id = ?",
+                (conversation_id, user_id)
+            ).fetchone()
+        if row is None:
+            return None, None
+        return self.get(user_id, row[0], row[1]), row[2]
+
+    def conversations(self, user_id: str, context_id: str) -> list:
+        """
+        (conversation_id, version, conversation_url) for conversations using a context.
+        """
+        with self._lock:
+            return [tuple(row) for row in self._db.execute(
+                "SELECT conversation_id, version, conversation_url FROM context_conversations "
+                "WHERE context_id = ? AND user_id = ?",
+                (context_id, user_id)
+            ).fetchall()]
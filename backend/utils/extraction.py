@@ -0,0 +1,249 @@
+# utils/extraction.py
+import os
+import shutil
+import asyncio
+import logging
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from utils.metrics import observe_stage, CHUNKS, IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction pool already has its maximum number of queued jobs."""
+
+
+# The functions below run inside worker processes, so they must stay module-level
+# and only exchange plain, picklable data with the parent.
+
+def count_pdf_pages(path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(path).pages)
+
+
+def extract_page_range(path: str, start: int, end: int) -> list:
+    """
+    Extract text for pages [start, end) of a PDF.
+    Metadata matches what PyPDFLoader produces.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    pages = []
+    for page_number in range(start, min(end, len(reader.pages))):
+        text = reader.pages[page_number].extract_text() or ""
+        pages.append({"page_content": text, "metadata": {"source": path, "page": page_number}})
+    return pages
+
+
+# Embedded images smaller than this (rules, bullets, logos) hold no readable text
+OCR_MIN_IMAGE_SIDE = 32
+OCR_TARGET_WIDTH = 2000
+OCR_MAX_HEIGHT = 6000
+
+
+def _ocr_image(image, lang: str) -> str:
+    from PIL import ImageOps
+    import pytesseract
+    if min(image.width, image.height) < OCR_MIN_IMAGE_SIDE:
+        return ""
+    # Tesseract would otherwise start one thread per core in every worker process
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    image = ImageOps.autocontrast(ImageOps.exif_transpose(image).convert("L"))
+    # Phone photos and low-DPI scans read much better at ~2000px wide; the height cap
+    # keeps narrow strips from turning into huge bitmaps
+    if image.width < 1500:
+        scale = min(OCR_TARGET_WIDTH / image.width, OCR_MAX_HEIGHT / image.height)
+        if scale > 1:
+            image = image.resize((int(image.width * scale), int(image.height * scale)))
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+def ocr_pdf_page(path: str, page_number: int, lang: str) -> str:
+    """
+    OCR the images embedded in one PDF page (a scanned page is usually one full-page image).
+    """
+    from pypdf import PdfReader
+    page = PdfReader(path).pages[page_number]
+    return "\n".join(_ocr_image(image.image, lang) for image in page.images).strip()
+
+
+def ocr_image_file(path: str, lang: str) -> str:
+    from PIL import Image, ImageSequence
+    with Image.open(path) as image:
+        return "\n".join(_ocr_image(frame.copy(), lang) for frame in ImageSequence.Iterator(image)).strip()
+
+
+_splitters = {}
+
+
+def split_pages(pages: list, options: dict) -> list:
+    """
+    Structure-aware split of page dicts; one splitter (and tokenizer) is kept per worker process.
+    """
+    from utils.splitting import StructuredSplitter
+    key = tuple(sorted(options.items()))
+    if key not in _splitters:
+        _splitters[key] = StructuredSplitter(**options)
+    return _splitters[key].split(pages)
+
+
+class ExtractionPool:
+    def __init__(
+        self,
+        max_workers: int = None,
+        max_queue: int = 8,
+        pages_per_task: int = 16,
+        ocr_cache=None,
+        ocr_lang: str = "eng",
+        ocr_enabled: bool = True,
+        min_text_chars: int = 20
+    ):
+        """
+        Bounded process pool for CPU-bound PDF parsing, OCR and splitting.
+        Large PDFs are cut into page ranges that are extracted in parallel.
+        Pages with fewer than min_text_chars of text (scans, photos) and image
+        uploads are OCR'd page by page with Tesseract; results are cached per
+        page in ocr_cache (a SummaryCache) keyed by file hash and page number.
+        At most max_workers + max_queue jobs are admitted at once; beyond that
+        ExtractionQueueFull is raised so the caller can push back.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.pages_per_task = pages_per_task
+        self.ocr_cache = ocr_cache
+        self.ocr_lang = ocr_lang
+        self.ocr_enabled = ocr_enabled
+        self.min_text_chars = min_text_chars
+        self._ocr_available = None
+        self._executor = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            logger.info("Started extraction pool with %d workers", self.max_workers)
+        return self._executor
+
+    def _acquire(self) -> None:
+        # Only touched from the event loop thread, so no lock is needed
+        if self._pending >= self.max_workers + self.max_queue:
+            logger.warning("Extraction queue full (%d pending)", self._pending)
+            raise ExtractionQueueFull("Extraction queue is full, try again shortly.")
+        self._pending += 1
+        IN_FLIGHT.labels(kind="extraction").inc()
+
+    def _release(self) -> None:
+        self._pending -= 1
+        IN_FLIGHT.labels(kind="extraction").dec()
+
+    @property
+    def ocr_available(self) -> bool:
+        if self._ocr_available is None:
+            self._ocr_available = bool(
+                self.ocr_enabled
+                and shutil.which("tesseract")
+                and importlib.util.find_spec("pytesseract")
+                and importlib.util.find_spec("PIL")
+            )
+            if self.ocr_enabled and not self._ocr_available:
+                logger.warning("OCR disabled: tesseract or pytesseract/Pillow is not installed")
+        return self._ocr_available
+
+    async def _ocr(self, cache_key: str, func, *args) -> str:
+        if self.ocr_cache is not None and cache_key is not None:
+            cached = await self.ocr_cache.get(cache_key)
+            if cached is not None:
+                return cached["text"]
+        with observe_stage("ocr"):
+            text = await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        if self.ocr_cache is not None and cache_key is not None:
+            await self.ocr_cache.set(cache_key, {"text": text})
+        return text
+
+    async def _ocr_pages(self, path: str, digest: str, pages: list) -> None:
+        # One task per page so a scanned document is OCR'd across all workers
+        texts = await asyncio.gather(*[
+            self._ocr(f"{digest}:{page['metadata']['page']}" if digest else None,
+                      ocr_pdf_page, path, page["metadata"]["page"], self.ocr_lang)
+            for page in pages
+        ], return_exceptions=True)
+        for page, text in zip(pages, texts):
+            if isinstance(text, Exception):
+                # One unreadable image doesn't fail the upload; the page keeps its text layer
+                logger.warning("OCR failed for page %d: %s", page["metadata"]["page"], text)
+                continue
+            page["page_content"] = text
+            page["metadata"]["ocr"] = True
+
+    async def load_pdf(self, path: str, digest: str = None) -> list:
+        """
+        Parse a PDF into one Document per page without blocking the event loop.
+        Pages without a usable text layer are OCR'd; digest (the file hash) keys the OCR cache.
+        """
+        self._acquire()
+        try:
+            with observe_stage("pdf_parse"):
+                loop = asyncio.get_running_loop()
+                executor = self._get_executor()
+                num_pages = await loop.run_in_executor(executor, count_pdf_pages, path)
+                ranges = [
+                    (start, min(start + self.pages_per_task, num_pages))
+                    for start in range(0, num_pages, self.pages_per_task)
+                ]
+                logger.info("Extracting %d pages in %d tasks", num_pages, len(ranges))
+                results = await asyncio.gather(*[
+                    loop.run_in_executor(executor, extract_page_range, path, start, end)
+                    for start, end in ranges
+                ])
+            pages = [page for pages in results for page in pages]
+            scanned = [page for page in pages if len(page["page_content"].strip()) < self.min_text_chars]
+            if scanned and self.ocr_available:
+                logger.info("Running OCR on %d of %d pages without a text layer", len(scanned), len(pages))
+                await self._ocr_pages(path, digest, scanned)
+        finally:
+            self._release()
+        from langchain.docstore.document import Document
+        return [Document(**page) for page in pages]
+
+    async def load_image(self, path: str, digest: str = None) -> list:
+        """
+        OCR an uploaded image (photo or scan of a page) into a single Document.
+        """
+        if not self.ocr_available:
+            return []
+        self._acquire()
+        try:
+            text = await self._ocr(digest, ocr_image_file, path, self.ocr_lang)
+        finally:
+            self._release()
+        from langchain.docstore.document import Document
+        return [Document(page_content=text, metadata={"source": path, "page": 0, "ocr": True})]
+
+    async def split(self, documents: list, **options) -> list:
+        """
+        Split Documents into chunks in a worker process.
+        options are passed to StructuredSplitter (chunk_tokens, min_tokens, max_chunks...).
+        """
+        self._acquire()
+        try:
+            pages = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
+            with observe_stage("split"):
+                splits = await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(), split_pages, pages, options
+                )
+        finally:
+            self._release()
+        CHUNKS.inc(len(splits))
+        from langchain.docstore.document import Document
+        return [Document(**split) for split in splits]
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            logger.info("Extraction pool shut down")
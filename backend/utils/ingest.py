@@ -0,0 +1,168 @@
+# utils/ingest.py
+import os
+import json
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from utils.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+
+# Multipart boundaries, part headers and small form fields on top of the file itself
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+class IngestedFile:
+    def __init__(self, source, digest: str, size: int, suffix: str = ""):
+        """
+        A hashed upload. The bytes stay in Starlette's spooled file; path() copies them
+        to a named temporary file only when something needs one (extraction workers,
+        S3 archival), so cache hits never write the upload to disk a second time.
+        """
+        self.source = source
+        self.digest = digest
+        self.size = size
+        self.suffix = suffix
+        self._path = None
+        self._copying = None
+
+    def _copy(self) -> str:
+        fd, path = tempfile.mkstemp(suffix=self.suffix)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                self.source.seek(0)
+                shutil.copyfileobj(self.source, tmp, DEFAULT_CHUNK_SIZE)
+        except BaseException:
+            os.unlink(path)
+            raise
+        logger.info("Spooled upload to %s (%d bytes)", path, self.size)
+        return path
+
+    async def path(self) -> str:
+        """
+        Path of a named copy of the upload, written on first use and shared by later callers.
+        """
+        if self._path is None:
+            if self._copying is None:
+                self._copying = asyncio.ensure_future(asyncio.to_thread(self._copy))
+            path = await asyncio.shield(self._copying)
+            self._path = path
+        return self._path
+
+    def cleanup(self) -> None:
+        path = self._path
+        if path is None and self._copying is not None and self._copying.done() and not self._copying.exception():
+            path = self._copying.result()
+        if path is not None:
+            try:
+                os.unlink(path)
+                logger.info("Temporary upload file deleted: %s", path)
+            except FileNotFoundError:
+                pass
+
+
+@asynccontextmanager
+async def spool_upload(file, max_bytes: int = None, suffix: str = "", chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Hash an UploadFile in place, one chunk at a time. Starlette has already spooled
+    the body by the time a handler runs, so oversized requests are rejected earlier by
+    UploadLimitMiddleware; the check here is on the exact file size. Any named copy
+    made through IngestedFile.path() is removed on exit.
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    with observe_stage("file_read"):
+        await file.seek(0)
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise UploadTooLarge(f"File exceeds the {max_bytes} byte upload limit.")
+            sha256.update(chunk)
+    upload = IngestedFile(file.file, sha256.hexdigest(), size, suffix)
+    try:
+        yield upload
+    finally:
+        if upload._copying is not None and not upload._copying.done():
+            # A copy still being written is removed once it finishes
+            await asyncio.gather(upload._copying, return_exceptions=True)
+        upload.cleanup()
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, max_bytes: int, paths: set):
+        """
+        ASGI middleware rejecting request bodies over max_bytes (plus form overhead)
+        on the given paths with 413 before they are spooled: from Content-Length when
+        it is declared, otherwise as soon as the streamed body passes the limit.
+        """
+        self.app = app
+        self.max_body = max_bytes + FORM_OVERHEAD_BYTES
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": f"File exceeds the {self.max_bytes} byte upload limit."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_body:
+            logger.warning("Rejecting %d byte upload to %s", declared, scope["path"])
+            await self._reject(send)
+            return
+
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    exceeded = True
+                    # Ends the body for the form parser; whatever the app answers is replaced by a 413
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            logger.warning("Rejecting streamed upload to %s over %d bytes", scope["path"], self.max_body)
+            await self._reject(send)
@@ -1,35 +1,201 @@
-from daily import Daily, EventHandler, CallClient
+import time
+import asyncio
+import logging
+import threading
 
-call_client = None
+logger = logging.getLogger(__name__)
 
-class RoomHandler(EventHandler):
-    def __init__(self):
-        super().__init__()
-    
-    def on_app_message(self, message, sender: str) -> None:
-        print(f"Incoming app message from {sender}: {message}")
+_daily_initialized = False
+_daily_init_lock = threading.Lock()
+
+
+def create_call_client():
+    """
+    Create a CallClient, initializing the Daily SDK once per process.
+    daily-python is imported here so it is only loaded when a room is joined.
+    """
+    global _daily_initialized
+    from daily import Daily, EventHandler, CallClient
+
+    class RoomHandler(EventHandler):
+        def __init__(self):
+            super().__init__()
+
+        def on_app_message(self, message, sender: str) -> None:
+            print(f"Incoming app message from {sender}: {message}")
+
+    with _daily_init_lock:
+        if not _daily_initialized:
+            Daily.init()
+            _daily_initialized = True
+    return CallClient(event_handler=RoomHandler())
 
 class DailyClient:
-    def __init__(self):
+    def __init__(self, call_client_factory=None):
         self.call_client = None
+        self.call_client_factory = call_client_factory or create_call_client
 
     def join_room(self, url):
         try:
-            Daily.init()
-            output_handler = RoomHandler()
-            self.call_client = CallClient(event_handler=output_handler)
+            self.call_client = self.call_client_factory()
             self.call_client.join(url)
         except Exception as e:
             print(f"Error joining room: {e}")
             raise
 
-    def send_message(self, conversation_id, context):
+    def leave_room(self):
+        if self.call_client is not None:
+            self.call_client.leave()
+            self.call_client.release()
+            self.call_client = None
+
+    def send_message(self, conversation_id, context, mode="overwrite"):
+        # "append" adds context to the end of what the replica already has,
+        # so only the new part travels over the call
         message = {
             "message_type": "conversation",
-            "event_type": "conversation.overwrite_llm_context",
+            "event_type": f"conversation.{mode}_llm_context",
             "conversation_id": conversation_id,
             "properties": {
                 "context": context
             }
         }
         self.call_client.send_app_message(message)
+
+
+class DailySessionManager:
+    def __init__(self, debounce: float = 0.5, idle_timeout: float = 300, call_client_factory=None):
+        """
+        Keeps one joined DailyClient per conversation so a single process can drive
+        many tutoring rooms. Context updates are coalesced: within each debounce
+        window only the latest context for a conversation is sent (appends made
+        in the same window are concatenated). Sessions unused
+        for idle_timeout seconds leave their room.
+        """
+        self.debounce = debounce
+        self.idle_timeout = idle_timeout
+        self.call_client_factory = call_client_factory
+        self._sessions = {}
+        self._last_used = {}
+        self._joining = {}
+        self._pending = {}
+        self._flushes = {}
+        self._reaper = None
+        self.sent = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def start(self) -> None:
+        self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def get_session(self, conversation_id: str, conversation_url: str) -> DailyClient:
+        """
+        Return the joined client for a conversation, joining its room on first use.
+        """
+        self._last_used[conversation_id] = time.monotonic()
+        session = self._sessions.get(conversation_id)
+        if session is not None:
+            return session
+
+        # Concurrent callers for the same conversation share one join
+        joining = self._joining.get(conversation_id)
+        if joining is None:
+            joining = asyncio.ensure_future(self._join(conversation_url))
+            self._joining[conversation_id] = joining
+        try:
+            session = await joining
+        finally:
+            self._joining.pop(conversation_id, None)
+        self._sessions[conversation_id] = session
+        return session
+
+    async def _join(self, conversation_url: str) -> DailyClient:
+        session = DailyClient(call_client_factory=self.call_client_factory)
+        await asyncio.to_thread(session.join_room, conversation_url)
+        logger.info("Joined Daily room: %s", conversation_url)
+        return session
+
+    async def update_context(self, conversation_id: str, conversation_url: str, context: str,
+                             mode: str = "overwrite") -> asyncio.Future:
+        """
+        Queue a context overwrite (or, with mode="append", an addition to the current
+        context); it is sent at the end of the current debounce window. Returns a
+        future that resolves once the update (coalesced with any others in the same
+        window) has been sent, or raises if sending failed.
+        """
+        pending = self._pending.get(conversation_id)
+        if pending is not None:
+            self.coalesced += 1
+            delivered = pending[3]
+            if mode == "append":
+                # Appending to a pending overwrite or append extends it
+                mode, context = pending[2], pending[1] + context
+        else:
+            delivered = asyncio.get_running_loop().create_future()
+            # Fire-and-forget callers never look at the outcome; failures are logged below
+            delivered.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._pending[conversation_id] = (conversation_url, context, mode, delivered)
+        if conversation_id not in self._flushes:
+            self._flushes[conversation_id] = asyncio.create_task(self._flush_after_debounce(conversation_id))
+        return delivered
+
+    async def send_context(self, conversation_id: str, conversation_url: str, context: str,
+                           mode: str = "overwrite") -> None:
+        """
+        Like update_context, but wait until the update has been sent; raises if it wasn't.
+        """
+        await asyncio.shield(await self.update_context(conversation_id, conversation_url, context, mode))
+
+    async def _flush_after_debounce(self, conversation_id: str) -> None:
+        delivered = None
+        try:
+            await asyncio.sleep(self.debounce)
+            conversation_url, context, mode, delivered = self._pending.pop(conversation_id)
+            session = await self.get_session(conversation_id, conversation_url)
+            await asyncio.to_thread(session.send_message, conversation_id, context, mode)
+            self.sent += 1
+            delivered.set_result(None)
+            logger.info("Sent context update to conversation: %s", conversation_id)
+        except Exception as e:
+            logger.error("Failed to update context for %s: %s", conversation_id, e)
+            if delivered is not None and not delivered.done():
+                delivered.set_exception(e)
+        finally:
+            self._flushes.pop(conversation_id, None)
+            if conversation_id in self._pending:
+                # An update arrived while this one was being sent; it gets its own window
+                self._flushes[conversation_id] = asyncio.create_task(self._flush_after_debounce(conversation_id))
+
+    async def evict(self, conversation_id: str) -> None:
+        session = self._sessions.pop(conversation_id, None)
+        self._last_used.pop(conversation_id, None)
+        if session is not None:
+            try:
+                await asyncio.to_thread(session.leave_room)
+            except Exception as e:
+                logger.error("Error leaving room for %s: %s", conversation_id, e)
+            logger.info("Evicted Daily session: %s", conversation_id)
+
+    async def _reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 30))
+            now = time.monotonic()
+            for conversation_id, last_used in list(self._last_used.items()):
+                if now - last_used > self.idle_timeout and conversation_id not in self._flushes:
+                    await self.evict(conversation_id)
+
+    async def aclose(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        # Deliver anything still waiting in a debounce window before leaving; a flush
+        # may schedule another for an update that arrived while it was sending
+        while self._flushes:
+            await asyncio.gather(*self._flushes.values(), return_exceptions=True)
+        for conversation_id in list(self._sessions):
+            await self.evict(conversation_id)
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "sent": self.sent, "coalesced": self.coalesced}
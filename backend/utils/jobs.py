@@ -0,0 +1,262 @@
+# utils/jobs.py
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from utils.sqlite import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue already holds its maximum number of pending jobs."""
+
+
+@dataclass
+class Job:
+    id: str
+    key: str
+    payload: dict = field(repr=False)
+    status: str = "queued"  # queued -> running -> done | failed
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    result: dict = field(default=None, repr=False)
+    error: str = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        return cls(
+            id=record["id"], key=record["key"], payload=None, status=record["status"],
+            created_at=record["created_at"], started_at=record["started_at"],
+            finished_at=record["finished_at"], result=record["result"], error=record["error"],
+        )
+
+
+class SQLiteJobStore(SQLiteStore):
+    def __init__(self, path: str, stale_after: float = 3600, retention: float = 86400):
+        """
+        Job state shared by every worker process on the host through one SQLite file,
+        so a job submitted to one worker can be polled and deduplicated from any other.
+        Queued/running records older than stale_after seconds (e.g. left behind by a
+        killed worker) are ignored for deduplication. Records are deleted retention
+        seconds after they finished (or were created, if they never did).
+        """
+        super().__init__(path)
+        self.stale_after = stale_after
+        self.retention = retention
+        self._saves = 0
+
+    def _setup(self, db: sqlite3.Connection) -> None:
+        db.row_factory = sqlite3.Row
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, "
+            "created_at REAL, started_at REAL, finished_at REAL, result TEXT, error TEXT)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, created_at)")
+
+    def save(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, key, status, created_at, started_at, finished_at, result, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.key, job.status, job.created_at, job.started_at, job.finished_at,
+                 json.dumps(job.result) if job.result is not None else None, job.error)
+            )
+            self._saves += 1
+            if self._saves % 64 == 0:
+                self._db.execute(
+                    "DELETE FROM jobs WHERE COALESCE(finished_at, created_at) < ?", (time.time() - self.retention,)
+                )
+            self._db.commit()
+
+    def _to_job(self, row) -> Job:
+        if row is None:
+            return None
+        record = dict(row)
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return Job.from_record(record)
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row)
+
+    def find_active(self, key: str) -> Job:
+        """
+        Latest job for key that is done, or queued/running and not stale.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE key = ? AND (status = 'done' OR "
+                "(status IN ('queued', 'running') AND created_at > ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, time.time() - self.stale_after)
+            ).fetchone()
+        return self._to_job(row)
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class JobQueue:
+    def __init__(self, handler, workers: int = 4, max_depth: int = 64, max_history: int = 1024, store: SQLiteJobStore = None):
+        """
+        Bounded in-process job queue drained by a pool of asyncio worker tasks.
+        handler(job) is awaited for each job and its return value becomes job.result.
+        Jobs are deduplicated by key (e.g. file hash): submitting a key that is queued,
+        running or done returns the existing job instead of doing the work twice.
+        With a store, job state is also written there so that other worker processes
+        can report on and deduplicate against it; results must then be JSON serializable.
+        """
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_history = max_history
+        self._queue = None
+        self._tasks = []
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._running = 0
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        logger.info("Started job queue with %d workers (max depth %d)", self.workers, self.max_depth)
+
+    async def stop(self, drain: bool = True) -> None:
+        """
+        Stop the workers, optionally waiting for queued and running jobs first.
+        """
+        if self._queue is None:
+            return
+        if drain:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Job queue stopped")
+
+    async def submit(self, key: str, payload: dict) -> tuple:
+        """
+        Queue a job, returning (job, created). created is False when an existing
+        job for the same key was returned; the caller keeps ownership of payload then.
+        """
+        existing = self._by_key.get(key)
+        if (existing is None or existing.status == "failed") and self.store is not None:
+            stored = await self.store.call(self.store.find_active, key)
+            # The same key may have been submitted here while the store was queried
+            current = self._by_key.get(key)
+            existing = current if current is not None and current.status != "failed" else stored
+        if existing is not None and existing.status != "failed":
+            logger.info("Deduplicated job for key %s -> %s", key, existing.id)
+            return existing, False
+
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started.")
+        job = Job(id=uuid.uuid4().hex, key=key, payload=payload)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logger.warning("Job queue full (%d queued)", self._queue.qsize())
+            raise JobQueueFull("Job queue is full, try again shortly.")
+
+        self._jobs[job.id] = job
+        self._by_key[key] = job
+        await self._save(job)
+        self._trim_history()
+        logger.info("Queued job %s (depth %d)", job.id, self._queue.qsize())
+        return job, True
+
+    async def get(self, job_id: str) -> Job:
+        job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = await self.store.call(self.store.get, job_id)
+        return job
+
+    async def _save(self, job: Job) -> None:
+        if self.store is None:
+            return
+        try:
+            # The store runs saves one at a time in order, so a job's states can't land out of order
+            await self.store.call(self.store.save, job)
+        except Exception as e:
+            logger.error("Failed to save job %s: %s", job.id, e)
+
+    def _trim_history(self) -> None:
+        # Forget the oldest finished jobs; queued and running ones are always kept
+        excess = len(self._jobs) - self.max_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            job = self._jobs[job_id]
+            if job.status in ("done", "failed"):
+                del self._jobs[job_id]
+                if self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+                excess -= 1
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            self._wait_times.append(job.started_at - job.created_at)
+            self._running += 1
+            await self._save(job)
+            try:
+                job.result = await self.handler(job)
+                job.status = "done"
+            except Exception as e:
+                logger.error("Job %s failed: %s", job.id, str(e))
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.payload = None
+                self._run_times.append(job.finished_at - job.started_at)
+                self._running -= 1
+                await self._save(job)
+                self._queue.task_done()
+
+    def metrics(self) -> dict:
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_depth": self.max_depth,
+            "running": self._running,
+            "workers": self.workers,
+            "jobs": counts,
+            "wait_seconds": {
+                "p50": percentile(self._wait_times, 0.5),
+                "p95": percentile(self._wait_times, 0.95),
+            },
+            "run_seconds": {
+                "p50": percentile(self._run_times, 0.5),
+                "p95": percentile(self._run_times, 0.95),
+            },
+        }
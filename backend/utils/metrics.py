@@ -0,0 +1,116 @@
+# utils/metrics.py
+import os
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set (gunicorn.conf.py) before this module is
+# imported, so every worker writes its samples there and /metrics aggregates them.
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "educaite_stage_seconds",
+    "Time spent in each processing stage (file_read, pdf_parse, split, map_call, reduce, tavus_create, ...)",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "educaite_http_request_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "educaite_llm_tokens_total",
+    "Estimated tokens sent to the LLM",
+    ["stage"],
+)
+CHUNKS = Counter(
+    "educaite_chunks_total",
+    "Document chunks produced by the splitter",
+)
+CACHE_LOOKUPS = Counter(
+    "educaite_cache_lookups_total",
+    "Cache lookups by namespace and result",
+    ["namespace", "result"],
+)
+IN_FLIGHT = Gauge(
+    "educaite_in_flight",
+    "Work currently in progress (requests, uploads, llm_calls, extraction)",
+    ["kind"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "educaite_admission_wait_seconds",
+    "Time admitted requests spent queued for a slot, by admission class (upload, conversation)",
+    ["endpoint"],
+    buckets=STAGE_BUCKETS,
+)
+ADMISSION_QUEUED = Gauge(
+    "educaite_admission_queued",
+    "Requests currently waiting for admission",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+ADMISSION_REJECTED = Counter(
+    "educaite_admission_rejected_total",
+    "Requests shed by admission control (rate_limited, user_queue_full, queue_full, timeout)",
+    ["endpoint", "reason"],
+)
+
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds the current request's trace id to every log record as %(trace_id)s.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get()
+        return True
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """
+    Time a block and record it in the per-stage histogram, whether or not it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def track_in_flight(kind: str):
+    gauge = IN_FLIGHT.labels(kind=kind)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def render_metrics() -> tuple:
+    """
+    Return (body, content_type) in the Prometheus text format, aggregated
+    across worker processes when running in multiprocess mode.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,200 @@
+# utils/persistence.py
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+TABLE_COLUMNS = {
+    "uploads": ["user_id", "file_url", "description", "created_at"],
+    "conversations": ["user_id", "conversation_url", "context", "created_at"],
+}
+
+
+def check_columns(table: str, columns: list) -> None:
+    """
+    Reject column names outside TABLE_COLUMNS; they come from the history query string.
+    """
+    allowed = set(TABLE_COLUMNS[table]) | {"id"}
+    unknown = set(columns) - allowed
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+
+
+class PersistenceBackend:
+    """
+    Storage used by BatchWriter and the history endpoints.
+    Implementations are blocking; callers run them in a thread.
+    """
+
+    def insert_many(self, table: str, rows: list) -> None:
+        raise NotImplementedError
+
+    def get_user_records(self, table: str, user_id: str, columns: list = None, limit: int = 20, offset: int = 0) -> list:
+        raise NotImplementedError
+
+
+class SupabaseBackend(PersistenceBackend):
+    def __init__(self, client=None):
+        """
+        Persistence on Supabase through one long-lived SupabaseClient.
+        """
+        if client is None:
+            from utils.utils import SupabaseClient
+            client = SupabaseClient()
+        self.client = client
+
+    def insert_many(self, table: str, rows: list) -> None:
+        # created_at is a timestamptz column; PostgREST rejects the whole batch for epoch floats
+        self.client.insert_records(table, [
+            {**row, "created_at": datetime.fromtimestamp(row["created_at"], timezone.utc).isoformat()}
+            if isinstance(row.get("created_at"), (int, float)) else row
+            for row in rows
+        ])
+
+    def get_user_records(self, table: str, user_id: str, columns: list = None, limit: int = 20, offset: int = 0) -> list:
+        if columns:
+            check_columns(table, columns)
+        return self.client.get_user_records(table, user_id, ",".join(columns) if columns else "*", limit, offset)
+
+
+class SQLiteBackend(PersistenceBackend):
+    def __init__(self, path: str):
+        """
+        Local stand-in for Supabase with the same tables, for development and tests.
+        A single connection is reused for every call.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        for table, columns in TABLE_COLUMNS.items():
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                + ", ".join(f"{column} {'REAL' if column == 'created_at' else 'TEXT'}" for column in columns)
+                + ")"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_user ON {table} (user_id, created_at)")
+        self._conn.commit()
+        logger.info("Initialized SQLite persistence at: %s", path)
+
+    def insert_many(self, table: str, rows: list) -> None:
+        columns = TABLE_COLUMNS[table]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [tuple(row.get(column) for column in columns) for row in rows]
+            )
+            self._conn.commit()
+
+    def get_user_records(self, table: str, user_id: str, columns: list = None, limit: int = 20, offset: int = 0) -> list:
+        columns = columns or ["id"] + TABLE_COLUMNS[table]
+        check_columns(table, columns)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(columns)} FROM {table} WHERE user_id = ? "
+                "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (user_id, limit, offset)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def build_persistence_backend(kind: str = None, path: str = None) -> PersistenceBackend:
+    """
+    "supabase" or "sqlite"; defaults to Supabase when its credentials are set.
+    """
+    kind = kind or ("supabase" if os.getenv("SUPABASE_URL") else "sqlite")
+    if kind == "supabase":
+        return SupabaseBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path or "data/educaite.sqlite3")
+    raise ValueError(f"Unknown persistence backend: {kind}")
+
+
+class BatchWriter:
+    def __init__(self, get_backend, max_batch: int = 50, flush_interval: float = 1.0, max_pending: int = 10000):
+        """
+        Buffers inserts in memory and writes them in batches, when a table reaches
+        max_batch rows or every flush_interval seconds, off the request path.
+        get_backend() returns the PersistenceBackend; it is called from a worker
+        thread on the first flush, so connecting never delays startup.
+        """
+        self.get_backend = get_backend
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = defaultdict(list)
+        self._wakeup = None
+        self._task = None
+        self._closing = False
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("Started batch writer (batch %d, interval %.1fs)", self.max_batch, self.flush_interval)
+
+    def enqueue(self, table: str, row: dict) -> None:
+        """
+        Buffer a row for insertion. Never blocks; drops the row if the buffer is full.
+        """
+        if self.pending >= self.max_pending:
+            self.dropped += 1
+            logger.error("Persistence buffer full, dropping %s record", table)
+            return
+        self._pending[table].append({"created_at": time.time(), **row})
+        if len(self._pending[table]) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _insert(self, table: str, rows: list) -> None:
+        self.get_backend().insert_many(table, rows)
+
+    async def flush(self) -> None:
+        batches, self._pending = self._pending, defaultdict(list)
+        for table, rows in batches.items():
+            for start in range(0, len(rows), self.max_batch):
+                batch = rows[start:start + self.max_batch]
+                try:
+                    await run_in_threadpool(self._insert, table, batch)
+                    self.written += len(batch)
+                    logger.info("Flushed %d %s records", len(batch), table)
+                except Exception as e:
+                    logger.error("Failed to flush %d %s records: %s", len(batch), table, e)
+                    self.dropped += len(batch)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._pending:
+                await self.flush()
+
+    async def aclose(self) -> None:
+        # Let an in-progress flush finish instead of cancelling it mid-batch
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info("Batch writer closed (%d written, %d dropped)", self.written, self.dropped)
+
+    def stats(self) -> dict:
+        return {"pending": self.pending, "written": self.written, "dropped": self.dropped}
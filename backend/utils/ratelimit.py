@@ -0,0 +1,130 @@
+# utils/ratelimit.py
+import time
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        Token bucket that starts full and refills continuously.
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """
+        Take amount tokens if available right now.
+        """
+        self._refill()
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return True
+        return False
+
+    def time_until(self, amount: float = 1) -> float:
+        """
+        Seconds until amount tokens will be available.
+        """
+        self._refill()
+        missing = min(amount, self.capacity) - self._tokens
+        return max(0.0, missing / self.refill_per_second)
+
+    async def acquire(self, amount: float = 1) -> None:
+        """
+        Wait until amount tokens are available and take them. Requests larger than
+        the bucket are clamped to its capacity so they can't wait forever.
+        Waiters are served in FIFO order.
+        """
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while not self.try_acquire(amount):
+                await asyncio.sleep(self.time_until(amount))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        requests_per_minute: int = 500,
+        tokens_per_minute: int = 200000,
+        max_in_flight: int = 16,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0
+    ):
+        """
+        Schedules LLM calls against requests-per-minute and tokens-per-minute budgets
+        shared by every caller in the process. On 429s all callers pause together,
+        with a backoff that grows while rate limiting persists and resets on success.
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+        self.in_flight = 0
+        self.rate_limited = 0
+
+    async def _wait_for_pause(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _backoff(self) -> float:
+        self._consecutive_limits += 1
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (self._consecutive_limits - 1)))
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    async def run(self, call, estimated_tokens: int = 0):
+        """
+        Await call() (a zero-argument coroutine factory) once budget and a slot are available.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_pause()
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    result = await call()
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == self.max_retries:
+                        raise
+                    self.rate_limited += 1
+                    delay = self._backoff()
+                    logger.warning("LLM rate limited, pausing all calls for %.2fs", delay)
+                    continue
+                finally:
+                    self.in_flight -= 1
+            self._consecutive_limits = 0
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "rate_limited": self.rate_limited,
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+        }
@@ -0,0 +1,125 @@
+# utils/retrieval.py
+import re
+import zlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+|[^\sA-Za-z0-9]")
+
+
+class HashingEmbedder:
+    def __init__(self, dim: int = 1024):
+        """
+        Fully local embedder: hashes unigrams and bigrams into a fixed-size vector
+        (signed feature hashing with sublinear term frequency), L2 normalized.
+        Needs no model download or network access.
+        """
+        self.dim = dim
+
+    def _features(self, text: str) -> list:
+        tokens = [token.lower() for token in TOKEN_RE.findall(text)]
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: list) -> np.ndarray:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode('utf-8'))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(vectors, (np.asarray(rows), np.asarray(cols)), np.asarray(signs, dtype=np.float32))
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    def __init__(self, embedder: HashingEmbedder):
+        """
+        Array-backed vector index over the chunks of one document, searched with
+        a single matrix-vector product.
+        """
+        self.embedder = embedder
+        self.vectors = np.zeros((0, embedder.dim), dtype=np.float32)
+        self.texts = []
+        self.metadatas = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add(self, texts: list, metadatas: list = None) -> None:
+        if not texts:
+            return
+        self.vectors = np.vstack([self.vectors, self.embedder.embed(texts)])
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas or [{} for _ in texts])
+
+    def search(self, query: str, k: int = 4) -> list:
+        """
+        Return up to k (score, text, metadata) tuples ordered by cosine similarity.
+        """
+        if not self.texts:
+            return []
+        scores = self.vectors @ self.embedder.embed([query])[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.texts[i], self.metadatas[i]) for i in top]
+
+
+class DocumentIndexStore:
+    def __init__(self, embedder: HashingEmbedder = None, max_indexes: int = 256):
+        """
+        Holds one VectorIndex per upload (keyed by file hash), evicting the least recently used.
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.max_indexes = max_indexes
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, upload_id: str, documents: list) -> VectorIndex:
+        index = VectorIndex(self.embedder)
+        index.add(
+            [doc.page_content for doc in documents if doc.page_content.strip()],
+            [doc.metadata for doc in documents if doc.page_content.strip()]
+        )
+        with self._lock:
+            self._indexes[upload_id] = index
+            self._indexes.move_to_end(upload_id)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        logger.info("Indexed %d chunks for upload: %s", len(index), upload_id)
+        return index
+
+    def get(self, upload_id: str) -> VectorIndex:
+        with self._lock:
+            index = self._indexes.get(upload_id)
+            if index is not None:
+                self._indexes.move_to_end(upload_id)
+            return index
+
+    def __contains__(self, upload_id: str) -> bool:
+        return upload_id in self._indexes
+
+
+def format_retrieved_context(base_context: str, question: str, hits: list) -> str:
+    """
+    Append the retrieved excerpts for a question to an existing conversation context.
+    """
+    context = base_context or ""
+    if not hits:
+        return context
+    context += f"\n# Relevant Excerpts for: {question}\n"
+    for _, text, metadata in hits:
+        page = metadata.get("page")
+        label = f"Page {page + 1}" if isinstance(page, int) else "Excerpt"
+        context += f"## {label}\n{text}\n"
+    return context
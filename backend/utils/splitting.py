@@ -0,0 +1,162 @@
+# utils/splitting.py
+import re
+import math
+import logging
+import numpy as np
+from utils.context import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+# Boundary strength of the block that starts at a line; chunks are cut at the strongest one available
+LINE, PARAGRAPH, PAGE, PROBLEM, SECTION = 0, 1, 2, 3, 4
+
+# "2 EDA (9 pts)", "Section 3", "Part B", "## Integrals"
+SECTION_RE = re.compile(
+    r"^\s*(?:\d{1,2}\s+[A-Z][^.]{1,80}\(\s*\d+\s*(?:pts?|points?)\b[^)]*\)\s*$"
+    r"|(?i:section|part|chapter|unit)\s+(?:\d+|[IVX]+|[A-Z])\b"
+    r"|#{1,3}\s)"
+)
+# "3. Find ...", "Problem 4", "Q2)", "(b) Show ...", "b) ..."
+PROBLEM_RE = re.compile(
+    r"^\s*(?:(?i:problem|question|exercise|q)\s*\d+"
+    r"|\d{1,3}[.)]\s+\S"
+    r"|\(\s*(?:[a-h]|i{1,3}|iv|v)\s*\)\s*\S"
+    r"|[a-h]\)\s+\S)"
+)
+
+
+def line_strength(line: str) -> int:
+    if SECTION_RE.match(line):
+        return SECTION
+    if PROBLEM_RE.match(line):
+        return PROBLEM
+    return LINE
+
+
+def segment_page(text: str) -> tuple:
+    """
+    Cut one page into blocks that start at a problem, section or paragraph boundary.
+    Returns (blocks, strengths) where strengths[i] is the boundary strength at block i.
+    """
+    blocks, strengths = [], []
+    current = []
+    pending = PAGE
+    for line in text.splitlines():
+        if not line.strip():
+            pending = max(pending, PARAGRAPH)
+            continue
+        strength = max(line_strength(line), pending)
+        if current and strength > LINE:
+            blocks.append("\n".join(current))
+            current = []
+        if not current:
+            strengths.append(strength)
+        current.append(line)
+        pending = LINE
+    if current:
+        blocks.append("\n".join(current))
+    return blocks, strengths
+
+
+def _split_text(text: str, pieces: int) -> list:
+    # Cut an oversized block into roughly equal parts at line or word breaks
+    parts = []
+    target = math.ceil(len(text) / pieces)
+    while len(text) > target:
+        cut = text.rfind("\n", 0, target)
+        if cut < target // 2:
+            cut = text.rfind(" ", 0, target)
+        if cut < target // 2:
+            cut = target
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text:
+        parts.append(text)
+    return parts
+
+
+class StructuredSplitter:
+    def __init__(self, chunk_tokens: int = 1500, min_tokens: int = 300, max_chunks: int = 64,
+                 max_chunk_tokens: int = 4000, counter: TokenCounter = None):
+        """
+        Splits homework/exam pages into chunks along problem and section boundaries.
+        Chunks are packed up to a token budget of chunk_tokens, raised for long documents
+        so there are at most max_chunks of them (never above max_chunk_tokens). Fragments
+        smaller than min_tokens are merged into their neighbours, and cuts prefer
+        section > problem > page > paragraph boundaries.
+        """
+        self.chunk_tokens = chunk_tokens
+        self.min_tokens = min_tokens
+        self.max_chunks = max_chunks
+        self.max_chunk_tokens = max_chunk_tokens
+        self.counter = counter or TokenCounter()
+
+    def _blocks(self, pages: list) -> tuple:
+        texts, strengths, page_index = [], [], []
+        for i, page in enumerate(pages):
+            blocks, block_strengths = segment_page(page["page_content"])
+            texts.extend(blocks)
+            strengths.extend(block_strengths)
+            page_index.extend([i] * len(blocks))
+        return texts, strengths, page_index
+
+    def budget(self, total_tokens: int) -> int:
+        return min(self.max_chunk_tokens, max(self.chunk_tokens, math.ceil(total_tokens / self.max_chunks)))
+
+    def split(self, pages: list) -> list:
+        """
+        Split page dicts ({"page_content", "metadata"}) into chunk dicts of the same shape.
+        Chunk metadata keeps the source and first page, plus page_end and tokens.
+        """
+        texts, strengths, page_index = self._blocks(pages)
+        if not texts:
+            return []
+        tokens = np.asarray(self.counter.count_many(texts), dtype=np.int64)
+        budget = self.budget(int(tokens.sum()))
+
+        # Blocks that alone exceed the budget are cut into line/word-aligned pieces
+        oversized = np.flatnonzero(tokens > budget)
+        if len(oversized):
+            for i in oversized[::-1]:
+                parts = _split_text(texts[i], math.ceil(tokens[i] / budget))
+                texts[i:i + 1] = parts
+                strengths[i:i + 1] = [strengths[i]] + [LINE] * (len(parts) - 1)
+                page_index[i:i + 1] = [page_index[i]] * len(parts)
+            tokens = np.asarray(self.counter.count_many(texts), dtype=np.int64)
+
+        strength = np.asarray(strengths + [SECTION], dtype=np.int8)
+        cumulative = np.concatenate(([0], np.cumsum(tokens)))
+        n = len(texts)
+
+        bounds = []
+        start = 0
+        while start < n:
+            if cumulative[n] - cumulative[start] <= budget:
+                end = n
+            else:
+                # Candidate cut points leave the chunk between min_tokens and budget tokens
+                hi = max(int(np.searchsorted(cumulative, cumulative[start] + budget, side="right")) - 1, start + 1)
+                lo = min(max(int(np.searchsorted(cumulative, cumulative[start] + self.min_tokens)), start + 1), hi)
+                window = strength[lo:hi + 1]
+                # Strongest boundary, latest on ties, so chunks stay as full as possible
+                end = hi - int(np.argmax(window[::-1]))
+            bounds.append((start, end))
+            start = end
+
+        # A tiny trailing fragment joins the previous chunk
+        if len(bounds) > 1 and cumulative[n] - cumulative[bounds[-1][0]] < self.min_tokens:
+            bounds[-2:] = [(bounds[-2][0], n)]
+
+        chunks = []
+        for start, end in bounds:
+            first, last = pages[page_index[start]], pages[page_index[end - 1]]
+            chunks.append({
+                "page_content": "\n".join(texts[start:end]),
+                "metadata": {
+                    **first["metadata"],
+                    "page_end": last["metadata"].get("page"),
+                    "tokens": int(cumulative[end] - cumulative[start]),
+                },
+            })
+        logger.info("Split %d pages into %d chunks (budget %d tokens)", len(pages), len(chunks), budget)
+        return chunks
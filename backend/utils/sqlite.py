@@ -0,0 +1,59 @@
+# utils/sqlite.py
+import os
+import asyncio
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    # Extra sqlite3.connect() arguments, e.g. {"isolation_level": None} for autocommit
+    connect_options = {}
+
+    def __init__(self, path: str, timeout: float = 30):
+        """
+        Base for state kept in one SQLite file (WAL mode) and shared by every worker
+        process on the host. The connection is opened lazily and reopened in each
+        process, because SQLite connections must not cross fork() (gunicorn --preload).
+        Subclasses create their tables in _setup(); self._lock serialises use of the
+        connection between threads. Async callers go through call(), which keeps
+        queries (and lock waits of up to timeout seconds) off the event loop.
+        """
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._executor = None
+        self._executor_pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _setup(self, db: sqlite3.Connection) -> None:
+        """Create tables and indexes; runs once per new connection."""
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout, **self.connect_options)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._setup(self._conn)
+            self._conn.commit()
+            self._pid = os.getpid()
+            logger.info("Opened SQLite %s at: %s", type(self).__name__, self.path)
+        return self._conn
+
+    async def call(self, func, *args):
+        """
+        Run func(*args) (a method of this store) on the store's own thread. One
+        thread per store is enough, since the connection is used under one lock,
+        and it keeps calls in submission order.
+        """
+        if self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=type(self).__name__)
+            self._executor_pid = os.getpid()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
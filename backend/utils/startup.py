@@ -0,0 +1,87 @@
+# utils/startup.py
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    def __init__(self):
+        """
+        Records how long each import group and component initialization took,
+        so cold-start regressions can be tracked.
+        """
+        self.started_at = time.perf_counter()
+        self.entries = []
+        self.ready_at = None
+
+    @contextmanager
+    def measure(self, name: str, phase: str = "import"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.entries.append({
+                "component": name,
+                "phase": phase,
+                "seconds": round(time.perf_counter() - start, 4),
+                "at": round(start - self.started_at, 4),
+            })
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        return {
+            "ready_after_seconds": round(self.ready_at - self.started_at, 4) if self.ready_at else None,
+            "components": self.entries,
+        }
+
+    def log(self) -> None:
+        for entry in sorted(self.entries, key=lambda e: -e["seconds"]):
+            logger.info("Startup %s %-24s %.3fs", entry["phase"], entry["component"], entry["seconds"])
+        if self.ready_at:
+            logger.info("Startup: ready after %.3fs", self.ready_at - self.started_at)
+
+
+class LazyComponent:
+    def __init__(self, name: str, factory, report: StartupReport = None):
+        """
+        Builds a component on first use (thread-safe) and records its init cost.
+        Async code uses aget(), which builds it in a worker thread.
+        """
+        self.name = name
+        self.factory = factory
+        self.report = report
+        self._value = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    def get(self):
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    logger.info("Initializing %s", self.name)
+                    if self.report is not None:
+                        with self.report.measure(self.name, phase="init"):
+                            self._value = self.factory()
+                    else:
+                        self._value = self.factory()
+                    self._initialized = True
+        return self._value
+
+    async def aget(self):
+        """
+        get() for async code: a first build (which can take seconds) runs in a
+        worker thread instead of blocking the event loop.
+        """
+        if self._initialized:
+            return self._value
+        return await asyncio.to_thread(self.get)
@@ -0,0 +1,163 @@
+# utils/summarize.py
+import asyncio
+import logging
+from utils.cache import SummaryCache, hash_bytes
+from utils.context import TokenCounter
+from utils.ratelimit import LLMScheduler
+from utils.metrics import observe_stage, track_in_flight, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentSummarizer:
+    # Rough allowance for prompt template and completion tokens per LLM call
+    CALL_OVERHEAD_TOKENS = 400
+
+    def __init__(
+        self,
+        summary_chain,
+        chunk_cache: SummaryCache = None,
+        scheduler: LLMScheduler = None,
+        counter: TokenCounter = None,
+        stuff_chain=None,
+        stuff_max_tokens: int = 12000,
+        reduce_max_tokens: int = 12000
+    ):
+        """
+        Picks a strategy from the document's token count:
+        - "stuff": one LLM call over the whole document when it fits in stuff_max_tokens
+        - "map_reduce": the map_reduce chain run in two explicit steps so the map results
+          can be memoized per chunk; only chunks not seen before go to the LLM
+        - partial summaries that together exceed reduce_max_tokens are first collapsed
+          in parallel groups, level by level (a tree), so reduce depth grows logarithmically
+        When a scheduler is given, every LLM call goes through its shared rate limits.
+        """
+        self.summary_chain = summary_chain
+        self.chunk_cache = chunk_cache
+        self.scheduler = scheduler
+        self.counter = counter or TokenCounter()
+        self.stuff_chain = stuff_chain
+        self.stuff_max_tokens = stuff_max_tokens
+        self.reduce_max_tokens = reduce_max_tokens
+
+    async def _call(self, call, text: str, stage: str):
+        estimated_tokens = self.counter.count(text) + self.CALL_OVERHEAD_TOKENS
+        LLM_TOKENS.labels(stage=stage).inc(estimated_tokens)
+        # Timed end to end, including any wait for the shared rate limits
+        with observe_stage(stage), track_in_flight("llm_calls"):
+            if self.scheduler is None:
+                return await call()
+            return await self.scheduler.run(call, estimated_tokens)
+
+    @staticmethod
+    def chunk_key(text: str) -> str:
+        return hash_bytes(text.encode('utf-8'))
+
+    async def map_chunks(self, splits: list, on_partial=None) -> list:
+        """
+        Return one partial summary per split, calling the LLM only for cache misses.
+        on_partial(index, summary) is awaited as each partial summary becomes available.
+        """
+        keys = [self.chunk_key(split.page_content) for split in splits]
+        partials = [None] * len(splits)
+        if self.chunk_cache is not None:
+            for i, key in enumerate(keys):
+                cached = await self.chunk_cache.get(key)
+                if cached is not None:
+                    partials[i] = cached["summary"]
+                    if on_partial is not None:
+                        await on_partial(i, partials[i])
+
+        missing = [i for i, partial in enumerate(partials) if partial is None]
+        logger.info("Map step: %d cached chunks, %d to summarize", len(splits) - len(missing), len(missing))
+
+        llm_chain = self.summary_chain.llm_chain
+        variable = self.summary_chain.document_variable_name
+
+        async def map_one(i):
+            text = splits[i].page_content
+            partials[i] = await self._call(lambda: llm_chain.apredict(**{variable: text}), text, "map_call")
+            if self.chunk_cache is not None:
+                await self.chunk_cache.set(keys[i], {"summary": partials[i]})
+            if on_partial is not None:
+                await on_partial(i, partials[i])
+
+        await asyncio.gather(*[map_one(i) for i in missing])
+        return partials
+
+    def document_tokens(self, splits: list) -> int:
+        # The structured splitter already records each chunk's token count
+        return sum(
+            split.metadata.get("tokens") or self.counter.count(split.page_content)
+            for split in splits
+        )
+
+    def choose_strategy(self, splits: list) -> str:
+        if self.stuff_chain is not None and self.document_tokens(splits) <= self.stuff_max_tokens:
+            return "stuff"
+        return "map_reduce"
+
+    async def stuff(self, splits: list) -> str:
+        """
+        Summarize the whole document in a single call.
+        """
+        text = "\n".join(split.page_content for split in splits)
+        output, _ = await self._call(lambda: self.stuff_chain.acombine_docs(splits), text, "stuff")
+        return output
+
+    def _group(self, docs: list, token_counts: list) -> list:
+        # Consecutive groups that each fit the reduce window, with at least two docs
+        # per group so every level makes progress
+        groups, current, current_tokens = [], [], 0
+        for doc, tokens in zip(docs, token_counts):
+            if len(current) >= 2 and current_tokens + tokens > self.reduce_max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(doc)
+            current_tokens += tokens
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        return groups
+
+    async def reduce(self, partials: list, splits: list) -> str:
+        """
+        Combine partial summaries with the chain's reduce prompt, collapsing them
+        level by level first when they don't fit in one call.
+        """
+        from langchain.docstore.document import Document
+        docs = [
+            Document(page_content=partial, metadata=split.metadata)
+            for partial, split in zip(partials, splits)
+        ]
+        combine_chain = self.summary_chain.reduce_documents_chain.combine_documents_chain
+
+        async def combine(group: list, stage: str) -> str:
+            text = "\n".join(doc.page_content for doc in group)
+            output, _ = await self._call(lambda: combine_chain.acombine_docs(group), text, stage)
+            return output
+
+        level = 0
+        token_counts = self.counter.count_many([doc.page_content for doc in docs])
+        while len(docs) > 1 and sum(token_counts) > self.reduce_max_tokens:
+            groups = self._group(docs, token_counts)
+            outputs = await asyncio.gather(*[combine(group, "collapse") for group in groups])
+            docs = [
+                Document(page_content=output, metadata=group[0].metadata)
+                for output, group in zip(outputs, groups)
+            ]
+            token_counts = self.counter.count_many(outputs)
+            level += 1
+            logger.info("Reduce level %d: collapsed into %d summaries", level, len(docs))
+        return await combine(docs, "reduce")
+
+    async def summarize(self, splits: list, on_partial=None) -> str:
+        if not splits:
+            return ""
+        strategy = self.choose_strategy(splits)
+        logger.info("Summarizing %d chunks with strategy: %s", len(splits), strategy)
+        if strategy == "stuff":
+            return await self.stuff(splits)
+        partials = await self.map_chunks(splits, on_partial=on_partial)
+        return await self.reduce(partials, splits)
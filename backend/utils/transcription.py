@@ -0,0 +1,158 @@
+# utils/transcription.py
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Whisper decodes 30 second windows; anything shorter can share a batch
+MAX_BATCH_SECONDS = 30
+
+
+class TranscriptionError(Exception):
+    """Raised when audio can't be decoded or transcribed."""
+
+
+async def decode_audio(content: bytes, input_format: str = None) -> np.ndarray:
+    """
+    Decode any ffmpeg-readable audio to 16 kHz mono float32 PCM.
+    ffmpeg output is read straight into a NumPy buffer and scaled in place.
+    """
+    args = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if input_format:
+        args += ["-f", input_format]
+    args += ["-i", "pipe:0", "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"]
+
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(content)
+    if process.returncode != 0:
+        raise TranscriptionError(f"ffmpeg failed: {stderr.decode('utf-8', 'ignore').strip()}")
+
+    audio = np.frombuffer(stdout, np.int16).astype(np.float32)
+    audio *= 1.0 / 32768.0
+    return audio
+
+
+class TranscriptionService:
+    def __init__(self, model_name: str = "base", workers: int = 1, batch_window: float = 0.05, max_batch: int = 8, device: str = "cpu"):
+        """
+        Shared Whisper transcription service. The model is loaded once, either on first
+        use or by warm_up(). Inference runs on a dedicated thread pool, and short clips
+        that arrive within batch_window of each other are decoded as one batch.
+        """
+        self.model_name = model_name
+        self.workers = workers
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.device = device
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="whisper")
+        self._queue = None
+        self._slots = None
+        self._batcher = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def warm_up(self):
+        """
+        Load the Whisper model if it isn't loaded yet. Blocking; safe to call from any thread.
+        """
+        with self._model_lock:
+            if self._model is None:
+                import whisper
+                logger.info("Loading Whisper model: %s", self.model_name)
+                self._model = whisper.load_model(self.model_name, device=self.device)
+                logger.info("Whisper model loaded")
+        return self._model
+
+    def _transcribe_batch(self, clips: list) -> list:
+        import torch
+        import whisper
+        model = self.warm_up()
+        mels = [
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(clip), n_mels=model.dims.n_mels)
+            for clip in clips
+        ]
+        options = whisper.DecodingOptions(fp16=self.device != "cpu")
+        results = whisper.decode(model, torch.stack(mels).to(model.device), options)
+        return [result.text.strip() for result in results]
+
+    def _transcribe_long(self, audio: np.ndarray) -> str:
+        model = self.warm_up()
+        result = model.transcribe(audio, fp16=self.device != "cpu")
+        return result["text"].strip()
+
+    async def _run_batch(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        clips = [clip for clip, _ in batch]
+        futures = [future for _, future in batch]
+        logger.info("Transcribing batch of %d clips", len(clips))
+        try:
+            texts = await loop.run_in_executor(self._executor, self._transcribe_batch, clips)
+            for future, text in zip(futures, texts):
+                if not future.done():
+                    future.set_result(text)
+        except Exception as e:
+            logger.error("Batch transcription failed: %s", e)
+            for future in futures:
+                if not future.done():
+                    future.set_exception(TranscriptionError(str(e)))
+        finally:
+            self._slots.release()
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        running = set()
+        while True:
+            # Wait for a free worker first, so clips pile up into bigger batches under load
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(batch))
+            running.add(task)
+            task.add_done_callback(running.discard)
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        """
+        Transcribe 16 kHz mono float32 audio. Clips up to 30 seconds are micro-batched;
+        longer recordings are transcribed on their own.
+        """
+        loop = asyncio.get_running_loop()
+        if len(audio) > MAX_BATCH_SECONDS * SAMPLE_RATE:
+            return await loop.run_in_executor(self._executor, self._transcribe_long, audio)
+
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._batcher = asyncio.create_task(self._run_batches())
+        future = loop.create_future()
+        await self._queue.put((audio, future))
+        return await future
+
+    async def transcribe_bytes(self, content: bytes, input_format: str = None) -> str:
+        return await self.transcribe(await decode_audio(content, input_format))
+
+    async def aclose(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
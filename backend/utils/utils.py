@@ -1,16 +1,18 @@
 # utils/utils.py
+import io
 import os
+import zlib
 import uuid
 import random
 import string
+import asyncio
 import logging
-import boto3
-import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from botocore.exceptions import NoCredentialsError, ClientError
 from dotenv import load_dotenv
-
-# Best use of supabase?
-from supabase import create_client, Client
+from utils.metrics import observe_stage
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -25,81 +27,203 @@ class Utils:
         return random_str
 
 
+class TextStream(io.RawIOBase):
+    def __init__(self, text: str, compress: bool = False, chunk_chars: int = 64 * 1024):
+        """
+        Readable file object that UTF-8 encodes (and optionally gzips) a string
+        piece by piece, so uploads never hold the whole encoded body in memory.
+        """
+        self.text = text
+        self.chunk_chars = chunk_chars
+        self._position = 0
+        self._buffer = b""
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self._finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self, size: int) -> None:
+        while len(self._buffer) < size and not self._finished:
+            piece = self.text[self._position:self._position + self.chunk_chars].encode('utf-8')
+            self._position += self.chunk_chars
+            if self._compressor is None:
+                self._buffer += piece
+                self._finished = self._position >= len(self.text)
+            elif piece:
+                self._buffer += self._compressor.compress(piece)
+            else:
+                self._buffer += self._compressor.flush()
+                self._finished = True
+
+    def readinto(self, buffer) -> int:
+        self._fill(len(buffer))
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
 class AWSClient:
-    def __init__(self):
-        """Initialize the AWS S3 client with credentials from environment variables."""
+    def __init__(
+        self,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        max_concurrency: int = 10,
+        max_pool_connections: int = 20
+    ):
+        """
+        Initialize the AWS S3 client with credentials from environment variables.
+        Files above multipart_threshold are uploaded in parallel multipart chunks.
+        AWS_ENDPOINT_URL points the client at an S3-compatible stand-in (moto, MinIO).
+        """
         self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
         self.aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
         self.bucket_name = os.getenv('AWS_BUCKET_NAME')
         self.region_name = os.getenv('AWS_REGION', 'us-east-1')  # Default region if not specified
+        self.endpoint_url = os.getenv('AWS_ENDPOINT_URL')
 
         if not all([self.aws_access_key_id, self.aws_secret_access_key, self.bucket_name]):
             logger.error("AWS credentials or bucket name not set in environment variables.")
             raise ValueError("AWS credentials or bucket name not set in environment variables.")
 
+        import boto3  # imported on first use to keep app startup fast
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
         self.s3 = boto3.client(
             's3',
             region_name=self.region_name,
+            endpoint_url=self.endpoint_url,
             aws_access_key_id=self.aws_access_key_id,
-            aws_secret_access_key=self.aws_secret_access_key
+            aws_secret_access_key=self.aws_secret_access_key,
+            config=Config(max_pool_connections=max_pool_connections, retries={"mode": "adaptive"})
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
         )
+        # Runs blocking transfers for the async wrappers and batch archiving
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3")
         logger.info("Initialized AWS S3 client")
 
-    def upload_file_to_s3(self, file, user_id: str) -> str:
-        """
-        Upload a file to S3 under a user-specific directory.
-        """
-        file_extension = file.filename.split('.')[-1]
-        unique_filename = f"{user_id}/{uuid.uuid4()}.{file_extension}"
+    def _upload(self, fileobj, key: str, extra_args: dict) -> str:
         try:
-            logger.info("Uploading file to S3: %s", unique_filename)
             self.s3.upload_fileobj(
-                file.file,
+                fileobj,
                 self.bucket_name,
-                unique_filename,
-                ExtraArgs={'ACL': 'private'}
+                key,
+                ExtraArgs={'ACL': 'private', **extra_args},
+                Config=self.transfer_config
             )
-            file_url = f"s3://{self.bucket_name}/{unique_filename}"
-            logger.info("File uploaded to S3 at: %s", file_url)
+            file_url = f"s3://{self.bucket_name}/{key}"
+            logger.info("Uploaded to S3 at: %s", file_url)
             return file_url
         except NoCredentialsError:
             logger.error("AWS credentials not available.")
             raise
         except ClientError as e:
-            logger.error("Failed to upload file to S3: %s", e)
+            logger.error("Failed to upload %s to S3: %s", key, e)
             raise
 
-    def save_text_to_s3(self, text: str, user_id: str) -> str:
+    def upload_file_to_s3(self, file, user_id: str) -> str:
         """
-        Save a text string as a .txt file in S3 under a user-specific directory.
+        Upload a file to S3 under a user-specific directory.
         """
-        unique_filename = f"{user_id}/{uuid.uuid4()}.txt"
-        try:
-            logger.info("Saving text to S3: %s", unique_filename)
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=unique_filename,
-                Body=text.encode('utf-8'),
-                ACL='private'
-            )
-            file_url = f"s3://{self.bucket_name}/{unique_filename}"
-            logger.info("Text saved to S3 at: %s", file_url)
-            return file_url
-        except NoCredentialsError:
-            logger.error("AWS credentials not available.")
-            raise
-        except ClientError as e:
-            logger.error("Failed to save text to S3: %s", e)
-            raise
+        file_extension = file.filename.split('.')[-1]
+        unique_filename = f"{user_id}/{uuid.uuid4()}.{file_extension}"
+        logger.info("Uploading file to S3: %s", unique_filename)
+        return self._upload(file.file, unique_filename, {})
 
+    def upload_path_to_s3(self, path: str, user_id: str, extension: str = None) -> str:
+        """
+        Upload a local file (e.g. a spooled upload) to S3 under a user-specific directory.
+        """
+        extension = extension or os.path.splitext(path)[1].lstrip('.') or "bin"
+        unique_filename = f"{user_id}/{uuid.uuid4()}.{extension}"
+        logger.info("Uploading %s to S3: %s", path, unique_filename)
+        with open(path, "rb") as f:
+            return self._upload(f, unique_filename, {})
 
-class TavusClient:
-    def __init__(self):
-        """Initialize the Tavus API client with credentials from environment variables."""
+    def save_text_to_s3(self, text: str, user_id: str, compress: bool = False) -> str:
+        """
+        Save a text string as a .txt file (.txt.gz when compressed) in S3 under a
+        user-specific directory. The text is encoded and compressed as it streams.
+        """
+        unique_filename = f"{user_id}/{uuid.uuid4()}.txt" + (".gz" if compress else "")
+        extra_args = {'ContentType': 'text/plain; charset=utf-8'}
+        if compress:
+            extra_args['ContentEncoding'] = 'gzip'
+        logger.info("Saving text to S3: %s", unique_filename)
+        return self._upload(TextStream(text, compress=compress), unique_filename, extra_args)
+
+    def _archive_item(self, item: dict, user_id: str) -> str:
+        if "text" in item:
+            return self.save_text_to_s3(item["text"], user_id, compress=item.get("compress", True))
+        return self.upload_path_to_s3(item["path"], user_id, item.get("extension"))
+
+    def archive_batch(self, items: list, user_id: str) -> list:
+        """
+        Archive many artifacts concurrently. Each item is {"text": ..., "compress": bool}
+        or {"path": ..., "extension": str}. Returns one S3 URL or exception per item, in order.
+        """
+        futures = [self._executor.submit(self._archive_item, item, user_id) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def aupload_path_to_s3(self, path: str, user_id: str, extension: str = None) -> str:
+        return await self._run(self.upload_path_to_s3, path, user_id, extension)
+
+    async def asave_text_to_s3(self, text: str, user_id: str, compress: bool = False) -> str:
+        return await self._run(self.save_text_to_s3, text, user_id, compress)
+
+    async def aarchive_batch(self, items: list, user_id: str) -> list:
+        """
+        Async archive_batch: items upload concurrently without blocking the event loop.
+        """
+        results = await asyncio.gather(
+            *[self._run(self._archive_item, item, user_id) for item in items],
+            return_exceptions=True
+        )
+        return list(results)
+
+
+class AsyncTavusClient:
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+    # POST creates a (billable) conversation, so it is only resent when Tavus cannot
+    # have acted on it: the connection was never made, or it was rate limited
+    NON_IDEMPOTENT_METHODS = {"POST"}
+    NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(
+        self,
+        base_url: str = None,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_concurrency: int = 10,
+        max_connections: int = 20
+    ):
+        """
+        Async Tavus API client on a shared keep-alive connection pool.
+        Requests time out, retry with jittered exponential backoff on 429/5xx and
+        transport errors (POSTs only on 429 and connection failures), and at most
+        max_concurrency run at once.
+        """
         self.api_key = os.getenv('TAVUS_API_KEY')
         self.replica_id = os.getenv('REPLICA_ID')
         self.persona_id = os.getenv('PERSONA_ID')
-        self.base_url = "https://tavusapi.com/v2"
+        self.base_url = base_url or os.getenv('TAVUS_BASE_URL', "https://tavusapi.com/v2")
 
         if not all([self.api_key, self.replica_id, self.persona_id]):
             logger.error("Tavus API credentials not set in environment variables.")
@@ -109,13 +233,70 @@ class TavusClient:
             "x-api-key": self.api_key,
             "Content-Type": "application/json"
         }
-        logger.info("Initialized Tavus API client")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_connections = max_connections
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+        logger.info("Initialized async Tavus API client")
 
-    def create_conversation(self, context: str, callback_url: str = None, conversation_name: str = "User Conversation") -> str:
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    def _backoff(self, attempt: int, response: httpx.Response = None) -> float:
+        if response is not None and "retry-after" in response.headers:
+            try:
+                return min(float(response.headers["retry-after"]), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        client = self._get_client()
+        idempotent = method.upper() not in self.NON_IDEMPOTENT_METHODS
+        retry_status_codes = self.RETRY_STATUS_CODES if idempotent else {429}
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = await client.request(method, path, **kwargs)
+                except httpx.TransportError as err:
+                    # A read timeout or dropped connection may come after Tavus processed the request
+                    if attempt == self.max_retries or not (idempotent or isinstance(err, self.NOT_SENT_ERRORS)):
+                        raise
+                    delay = self._backoff(attempt)
+                    logger.warning("Tavus %s %s failed (%s), retrying in %.2fs", method, path, err, delay)
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.status_code in retry_status_codes and attempt < self.max_retries:
+                    delay = self._backoff(attempt, response)
+                    logger.warning("Tavus %s %s returned %d, retrying in %.2fs", method, path, response.status_code, delay)
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.is_error:
+                    logger.error("HTTP error %d from Tavus %s %s", response.status_code, method, path)
+                    logger.error("Response: %s", response.text)
+                response.raise_for_status()
+                return response
+
+    async def create_conversation(self, context: str, callback_url: str = None, conversation_name: str = "User Conversation") -> str:
         """
         Create a conversation with Tavus AI.
         """
-        url = f"{self.base_url}/conversations"
         logger.info(f"self.replica_id: {self.replica_id}")
         logger.info(f"self.persona_id: {self.persona_id}")
         payload = {
@@ -134,63 +315,47 @@ class TavusClient:
 
         try:
             logger.info("Creating conversation with Tavus AI")
-            response = requests.post(url, json=payload, headers=self.headers)
-            response.raise_for_status()  # Raise an exception for HTTP errors
+            with observe_stage("tavus_create"):
+                response = await self._request("POST", "/conversations", json=payload)
             data = response.json()
             conversation_url = data.get("conversation_url")
             logger.info("Conversation created: %s", conversation_url)
             return conversation_url
-        except requests.exceptions.HTTPError as http_err:
-            logger.error("HTTP error occurred while creating conversation: %s", http_err)
-            logger.error("Response: %s", response.text)
-            raise
         except Exception as err:
             logger.error("An error occurred while creating conversation: %s", err)
             raise
 
-    def get_replica(self, replica_id: str = None, verbose: bool = False) -> dict:
+    async def get_replica(self, replica_id: str = None, verbose: bool = False) -> dict:
         """
         Retrieve information about a specific replica.
         """
         replica_id = replica_id or self.replica_id
-        url = f"{self.base_url}/replicas/{replica_id}"
         params = {"verbose": str(verbose).lower()}  # 'true' or 'false'
 
         try:
             logger.info("Fetching replica information for: %s", replica_id)
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
+            response = await self._request("GET", f"/replicas/{replica_id}", params=params)
             data = response.json()
             logger.debug("Replica data: %s", data)
             return data
-        except requests.exceptions.HTTPError as http_err:
-            logger.error("HTTP error occurred while fetching replica: %s", http_err)
-            logger.error("Response: %s", response.text)
-            raise
         except Exception as err:
             logger.error("An error occurred while fetching replica: %s", err)
             raise
 
-    def update_conversation_context(self, conversation_id: str, new_context: str) -> dict:
+    async def update_conversation_context(self, conversation_id: str, new_context: str) -> dict:
         """
         Update the context of an existing conversation.
         """
-        url = f"{self.base_url}/conversations/{conversation_id}"
         payload = {
             "conversational_context": new_context
         }
 
         try:
             logger.info("Updating conversation context for: %s", conversation_id)
-            response = requests.patch(url, json=payload, headers=self.headers)
-            response.raise_for_status()
+            response = await self._request("PATCH", f"/conversations/{conversation_id}", json=payload)
             data = response.json()
             logger.info("Conversation context updated successfully")
             return data
-        except requests.exceptions.HTTPError as http_err:
-            logger.error("HTTP error occurred while updating context: %s", http_err)
-            logger.error("Response: %s", response.text)
-            raise
         except Exception as err:
             logger.error("An error occurred while updating context: %s", err)
             raise
@@ -201,6 +366,62 @@ class TavusClient:
         """
         return conversation_url.split('/')[-1]
 
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class TavusClient:
+    def __init__(self, **kwargs):
+        """
+        Blocking Tavus API client. Thin wrapper that runs AsyncTavusClient on a private
+        background event loop, so it is safe to call from any thread.
+        """
+        self._async_client = AsyncTavusClient(**kwargs)
+        self.api_key = self._async_client.api_key
+        self.replica_id = self._async_client.replica_id
+        self.persona_id = self._async_client.persona_id
+        self.base_url = self._async_client.base_url
+        self.headers = self._async_client.headers
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="tavus-client", daemon=True)
+        self._thread.start()
+        logger.info("Initialized Tavus API client")
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def create_conversation(self, context: str, callback_url: str = None, conversation_name: str = "User Conversation") -> str:
+        """
+        Create a conversation with Tavus AI.
+        """
+        return self._run(self._async_client.create_conversation(context, callback_url, conversation_name))
+
+    def get_replica(self, replica_id: str = None, verbose: bool = False) -> dict:
+        """
+        Retrieve information about a specific replica.
+        """
+        return self._run(self._async_client.get_replica(replica_id, verbose))
+
+    def update_conversation_context(self, conversation_id: str, new_context: str) -> dict:
+        """
+        Update the context of an existing conversation.
+        """
+        return self._run(self._async_client.update_conversation_context(conversation_id, new_context))
+
+    def get_conversation_id(self, conversation_url: str) -> str:
+        """
+        Get the conversation ID from the conversation URL.
+        """
+        return self._async_client.get_conversation_id(conversation_url)
+
+    def close(self) -> None:
+        self._run(self._async_client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
 
 class SupabaseClient:
     def __init__(self):
@@ -212,6 +433,8 @@ class SupabaseClient:
             logger.error("Supabase credentials not set in environment variables.")
             raise ValueError("Supabase credentials not set in environment variables.")
 
+        # Best use of supabase? Imported on first use to keep app startup fast
+        from supabase import create_client, Client
         self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
         logger.info("Initialized Supabase client")
 
@@ -261,38 +484,43 @@ class SupabaseClient:
             logger.error("An error occurred while creating conversation record: %s", e)
             raise
 
-    def get_user_uploads(self, user_id: str) -> list:
+    def insert_records(self, table: str, rows: list) -> list:
         """
-        Retrieve all uploads for a specific user.
+        Insert many rows into a table with a single request.
         """
         try:
-            logger.info("Retrieving uploads for user: %s", user_id)
-            response = self.supabase.table("uploads").select("*").eq("user_id", user_id).execute()
+            logger.info("Inserting %d records into Supabase table: %s", len(rows), table)
+            response = self.supabase.table(table).insert(rows).execute()
             logger.debug("Supabase response: %s", response)
-            if response.status_code == 200:
-                logger.info("Uploads retrieved successfully")
-                return response.data
-            else:
-                logger.error("Failed to retrieve uploads: %s", response.error)
-                raise Exception(response.error)
+            return response.data
         except Exception as e:
-            logger.error("An error occurred while retrieving uploads: %s", e)
+            logger.error("An error occurred while inserting records into %s: %s", table, e)
             raise
 
-    def get_user_conversations(self, user_id: str) -> list:
+    def get_user_records(self, table: str, user_id: str, columns: str = "*", limit: int = None, offset: int = 0) -> list:
         """
-        Retrieve all conversations for a specific user.
+        Retrieve one page of a user's records, newest first, fetching only the given columns.
         """
         try:
-            logger.info("Retrieving conversations for user: %s", user_id)
-            response = self.supabase.table("conversations").select("*").eq("user_id", user_id).execute()
+            logger.info("Retrieving %s for user: %s (limit=%s, offset=%d)", table, user_id, limit, offset)
+            query = self.supabase.table(table).select(columns).eq("user_id", user_id).order("created_at", desc=True)
+            if limit is not None:
+                query = query.range(offset, offset + limit - 1)
+            response = query.execute()
             logger.debug("Supabase response: %s", response)
-            if response.status_code == 200:
-                logger.info("Conversations retrieved successfully")
-                return response.data
-            else:
-                logger.error("Failed to retrieve conversations: %s", response.error)
-                raise Exception(response.error)
+            return response.data
         except Exception as e:
-            logger.error("An error occurred while retrieving conversations: %s", e)
+            logger.error("An error occurred while retrieving %s: %s", table, e)
             raise
+
+    def get_user_uploads(self, user_id: str, columns: str = "*", limit: int = None, offset: int = 0) -> list:
+        """
+        Retrieve uploads for a specific user, optionally paginated.
+        """
+        return self.get_user_records("uploads", user_id, columns, limit, offset)
+
+    def get_user_conversations(self, user_id: str, columns: str = "*", limit: int = None, offset: int = 0) -> list:
+        """
+        Retrieve conversations for a specific user, optionally paginated.
+        """
+        return self.get_user_records("conversations", user_id, columns, limit, offset)
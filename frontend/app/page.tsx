@@ -49,6 +49,7 @@ export default function Home() {
         const data = response.data
         console.log('data', data)
         localStorage.setItem('context', data.context)
+        localStorage.setItem('context_id', data.context_id)
         // router.push('/record')
       } catch (error) {
         console.error('Error uploading:', error)
@@ -56,20 +57,22 @@ export default function Home() {
 
       
       const existingContext = localStorage.getItem('context') || '';
+      const contextId = localStorage.getItem('context_id');
       // const userContext = localStorage.getItem('userContext') || '';
       // console.log('userContext', userContext)
       console.log('existingContext', existingContext)
       // const updatedContext = `${existingContext}\n\n# Student's Current Situation Context:\n${userContext}`;
       try {
-        const conversationResponse = await axios.post(`${baseUrl}/create_conversation`, {
-          context: existingContext
-        }, {
+        // The server keeps the context; send its id rather than the full text
+        const conversationResponse = await axios.post(`${baseUrl}/create_conversation`,
+          contextId ? { context_id: contextId } : { context: existingContext }, {
           headers: {
             'Content-Type': 'application/json'
           }
         });
         const conversationData = conversationResponse.data;
         localStorage.setItem('conversation_url', conversationData.conversation_url);
+        localStorage.setItem('conversation_id', conversationData.conversation_id);
       } catch (error) {
         if (axios.isAxiosError(error)) {
           if (error.response?.status === 422) {
@@ -78,16 +78,21 @@ export default function RecordPage() {
       console.log('userContext', userContext)
       console.log('existingContext', existingContext)
       const updatedContext = `${existingContext}\n\n# Student's Current Situation Context:\n${userContext}`;
+      const contextId = localStorage.getItem('context_id');
       try {
-        const conversationResponse = await axios.post(`${baseUrl}/create_conversation`, {
-          context: updatedContext
-        }, {
+        // With a stored context only the new section is sent; it is added to the upload's
+        // context (version 1) for this conversation only, so retries don't stack sections
+        const conversationRequest = contextId
+          ? { context_id: contextId, version: 1, append: `\n\n# Student's Current Situation Context:\n${userContext}` }
+          : { context: updatedContext };
+        const conversationResponse = await axios.post(`${baseUrl}/create_conversation`, conversationRequest, {
           headers: {
             'Content-Type': 'application/json'
           }
         });
         const conversationData = conversationResponse.data;
         localStorage.setItem('conversation_url', conversationData.conversation_url);
+        localStorage.setItem('conversation_id', conversationData.conversation_id);
       } catch (error) {
         if (axios.isAxiosError(error)) {
           if (error.response?.status === 422) {